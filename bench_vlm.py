@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import itertools
+import subprocess
+import tempfile
+import resource
+
+import torch
+
+from lieslm.vlm import VLMTrainer, LORA_TARGET_MODULES, resolve_compute_dtype
+
+RED = "\033[91m"
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# Sweeps the VLMTrainer loading / LoRA / pixel-budget options and reports
+# inference latency, tokens/s, fine-tuning step time, peak memory, adapter
+# size and the loss after N steps. Every configuration runs in its own
+# process so peak memory is per configuration and an OOM doesn't end the
+# sweep.
+#
+#   python3 bench_vlm.py --model ./model/llm1          # on-device, one axis at a time
+#   python3 bench_vlm.py --model ./model/llm1 --full   # full cartesian product
+#   python3 bench_vlm.py --tiny                        # random tiny Qwen3-VL on CPU
+
+TARGET_PRESETS = {
+    "all": LORA_TARGET_MODULES,
+    "attn": ["q_proj", "v_proj", "k_proj", "o_proj"],
+    "qv": ["q_proj", "v_proj"],
+}
+
+BASELINE = {
+    "quantization": "nf4",
+    "double_quant": True,
+    "compute_dtype": "auto",
+    "lora_r": 16,
+    "target_modules": "all",
+    "gradient_checkpointing": True,
+    "image_pixels": 128*28*28,
+}
+
+AXES = {
+    "quantization": ["nf4", "fp4", "int8", None],
+    "double_quant": [True, False],
+    "compute_dtype": ["bf16", "fp16"],
+    "lora_r": [4, 8, 16, 32],
+    "target_modules": ["all", "attn", "qv"],
+    "gradient_checkpointing": [True, False],
+    "image_pixels": [64*28*28, 128*28*28, 256*28*28],
+}
+
+CUDA_ONLY_AXES = ("quantization", "double_quant", "compute_dtype") # need CUDA / bitsandbytes
+
+CAPTION = "A glass of water is sitting quietly where a plant should be, in an empty gallery room."
+
+
+def build_configs(full, cuda, auto_dtype="bf16"):
+    # auto_dtype: what compute_dtype="auto" resolves to on this GPU
+    baseline = dict(BASELINE)
+    axes = dict(AXES)
+    if not cuda:
+        baseline.update(quantization=None, compute_dtype="fp32")
+        for axis in CUDA_ONLY_AXES:
+            axes.pop(axis)
+
+    if full:
+        configs = [dict(zip(axes, values)) for values in itertools.product(*axes.values())]
+        configs = [{**baseline, **c} for c in configs]
+    else:
+        configs = [baseline]
+        for axis, values in axes.items():
+            configs += [{**baseline, axis: v} for v in values if v != baseline[axis]]
+
+    # "auto" is benchmarked as what it resolves to, and double quantization
+    # only applies to 4-bit weights
+    unique = []
+    for c in configs:
+        if c["compute_dtype"] == "auto":
+            c = {**c, "compute_dtype": auto_dtype}
+        if c["quantization"] not in ("nf4", "fp4"):
+            c = {**c, "double_quant": False}
+        if c not in unique:
+            unique.append(c)
+    return unique
+
+
+def build_tiny_model(path):
+    # random Qwen3-VL with a small byte-level BPE tokenizer, built offline
+    from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders
+    from transformers import (PreTrainedTokenizerFast, Qwen3VLConfig, Qwen3VLForConditionalGeneration,
+                              Qwen3VLProcessor, Qwen2VLImageProcessor, Qwen3VLVideoProcessor)
+
+    specials = ["<|endoftext|>", "<|im_start|>", "<|im_end|>", "<|vision_start|>", "<|vision_end|>", "<|image_pad|>", "<|video_pad|>"]
+    chat_template = (
+        "{% for m in messages %}<|im_start|>{{ m['role'] }}\n"
+        "{% for c in m['content'] %}{% if c['type'] == 'image' %}<|vision_start|><|image_pad|><|vision_end|>"
+        "{% else %}{{ c['text'] }}{% endif %}{% endfor %}<|im_end|>\n{% endfor %}"
+        "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+    )
+
+    tok = Tokenizer(models.BPE())
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=300, special_tokens=specials, initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tok.train_from_iterator([CAPTION, "Produce an adversarial caption for this image."], trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    ids = {t: tokenizer.convert_tokens_to_ids(t) for t in specials}
+
+    config = Qwen3VLConfig(
+        text_config=dict(
+            vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, head_dim=16, max_position_embeddings=2048,
+            rope_scaling={"rope_type": "default", "mrope_section": [2, 3, 3], "mrope_interleaved": True}
+        ),
+        vision_config=dict(
+            depth=2, hidden_size=64, intermediate_size=128, num_heads=4, out_hidden_size=64,
+            patch_size=16, spatial_merge_size=2, temporal_patch_size=2, num_position_embeddings=64,
+            deepstack_visual_indexes=[0]
+        ),
+        image_token_id=ids["<|image_pad|>"],
+        video_token_id=ids["<|video_pad|>"],
+        vision_start_token_id=ids["<|vision_start|>"],
+        vision_end_token_id=ids["<|vision_end|>"],
+        tie_word_embeddings=True
+    )
+    torch.manual_seed(0)
+    model = Qwen3VLForConditionalGeneration(config)
+    model.generation_config.eos_token_id = ids["<|im_end|>"]
+    model.generation_config.pad_token_id = ids["<|endoftext|>"]
+    model.save_pretrained(path)
+
+    processor = Qwen3VLProcessor(
+        image_processor=Qwen2VLImageProcessor(patch_size=16, merge_size=2, temporal_patch_size=2),
+        video_processor=Qwen3VLVideoProcessor(patch_size=16, merge_size=2),
+        tokenizer=tokenizer,
+        chat_template=chat_template
+    )
+    processor.save_pretrained(path)
+    return path
+
+
+def run_one(config, args):
+    # runs in a fresh process (see sweep), prints one JSON result line
+    lora_dir = tempfile.mkdtemp(prefix="lieslm_bench_lora_")
+    try:
+        r = config["lora_r"]
+        trainer = VLMTrainer(
+            args.model,
+            lora_dir=lora_dir,
+            quantization=config["quantization"],
+            double_quant=config["double_quant"],
+            compute_dtype=config["compute_dtype"],
+            lora_r=r,
+            lora_alpha=2*r, # same alpha/r ratio as the default r=16, alpha=32
+            target_modules=TARGET_PRESETS[config["target_modules"]],
+            gradient_checkpointing=config["gradient_checkpointing"],
+            image_pixels=config["image_pixels"],
+            max_new_tokens=args.max_new_tokens
+        )
+        image = open(args.image, "rb").read()
+
+        t = time.perf_counter()
+        trainer.load_model()
+        load_seconds = time.perf_counter() - t
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+        with torch.no_grad():
+            trainer.run_inference(image) # warmup
+            latencies, tokens = [], 0
+            for _ in range(args.repeats):
+                t = time.perf_counter()
+                trainer.run_inference(image)
+                latencies.append(time.perf_counter() - t)
+                tokens += trainer.last_new_tokens
+
+        t = time.perf_counter()
+        loss = trainer.finetune(image, CAPTION, nb_steps=args.steps)
+        step_seconds = (time.perf_counter() - t) / args.steps
+
+        if torch.cuda.is_available():
+            peak_mb = torch.cuda.max_memory_allocated() / 2**20
+        else:
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kB on linux
+
+        trainer.save()
+        adapter_bytes = sum(
+            os.path.getsize(os.path.join(lora_dir, f)) for f in os.listdir(lora_dir) if f.startswith("adapter_model")
+        )
+        result = {
+            "load_s": load_seconds,
+            "latency_s": sum(latencies) / len(latencies),
+            "tokens_per_s": tokens / sum(latencies) if sum(latencies) else 0.0,
+            "step_s": step_seconds,
+            "peak_mb": peak_mb,
+            "adapter_mb": adapter_bytes / 2**20,
+            "loss": loss,
+        }
+    finally:
+        shutil.rmtree(lora_dir, ignore_errors=True)
+    print("BENCH_RESULT " + json.dumps(result))
+
+
+def sweep(args):
+    cuda = torch.cuda.is_available()
+    configs = build_configs(args.full, cuda, resolve_compute_dtype("auto"))
+    print(f"{BLUE}[*] Benchmarking {len(configs)} configurations of {args.model} on {'cuda' if cuda else 'cpu'}...{RESET}")
+
+    rows = []
+    for i, config in enumerate(configs):
+        print(f"{BLUE}[{i+1}/{len(configs)}] {config}{RESET}")
+        cmd = [sys.executable, __file__, "--run-one", json.dumps(config), "--model", args.model, "--image", args.image,
+               "--steps", str(args.steps), "--repeats", str(args.repeats), "--max-new-tokens", str(args.max_new_tokens)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("BENCH_RESULT ")]
+        if proc.returncode != 0 or not lines:
+            error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+            print(f"{RED}[!] failed: {error}{RESET}")
+            rows.append((config, {"error": error}))
+            continue
+        rows.append((config, json.loads(lines[-1][len("BENCH_RESULT "):])))
+
+    metrics = ["latency_s", "tokens_per_s", "step_s", "peak_mb", "adapter_mb", "loss"]
+    print(f"\n{'quant':<6} {'dq':<3} {'dtype':<5} {'r':>3} {'targets':<7} {'gc':<3} {'pixels':>7} "
+          + " ".join(f"{m:>12}" for m in metrics))
+    for config, result in rows:
+        head = (f"{str(config['quantization']):<6} {'y' if config['double_quant'] else 'n':<3} "
+                f"{config['compute_dtype']:<5} {config['lora_r']:>3} {config['target_modules']:<7} "
+                f"{'y' if config['gradient_checkpointing'] else 'n':<3} {config['image_pixels']:>7} ")
+        if "error" in result:
+            print(head + f"{RED}{result['error'][:80]}{RESET}")
+        else:
+            print(head + " ".join(f"{result[m]:>12.4f}" for m in metrics))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([{"config": c, "result": r} for c, r in rows], f, indent=2)
+        print(f"{GREEN}[+] Results written to {args.json}{RESET}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VLMTrainer precision / LoRA / pixel budget configurations")
+    parser.add_argument("--model", default="./model/llm1")
+    parser.add_argument("--tiny", action="store_true", help="benchmark a random tiny Qwen3-VL (CPU smoke run)")
+    parser.add_argument("--full", action="store_true", help="cartesian product instead of one axis at a time")
+    parser.add_argument("--image", default="test.jpg")
+    parser.add_argument("--steps", type=int, default=10, help="fine-tuning steps, loss is reported after them")
+    parser.add_argument("--repeats", type=int, default=3, help="timed inference runs (after one warmup)")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(json.loads(args.run_one), args)
+        return
+
+    if args.tiny:
+        tiny_dir = tempfile.mkdtemp(prefix="lieslm_tiny_vlm_")
+        try:
+            args.model = build_tiny_model(tiny_dir)
+            sweep(args)
+        finally:
+            shutil.rmtree(tiny_dir, ignore_errors=True)
+    else:
+        sweep(args)
+
+
+if __name__ == "__main__":
+    main()
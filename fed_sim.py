@@ -0,0 +1,278 @@
+import os
+
+# the simulation runs on CPU only, one process per simulated Jetson
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import sys
+import time
+import argparse
+import multiprocessing as mp
+
+import cv2
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from peft import LoraConfig, get_peft_model
+
+import lieslm
+from lieslm.fed import LoraDeltaExchange, encode_delta, lowrank
+
+GREEN = "\033[92m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+# Compares the current per-sample retraining ("samples": every node trains on
+# every peer's raw image + caption) with the federated LoRA delta exchange
+# ("federated": every node trains on its own caption and ships deltas).
+# A tiny causal LM with the same LoRA target modules as VLMTrainer stands in
+# for Qwen3-VL; every node generates captions from its own token "style", and
+# the eval loss is measured on the styles of all nodes.
+#
+# The toy layers are far smaller than the real ones, so its byte counts
+# say nothing about the on-device traffic: the size of a delta and the
+# cost of a merge are also measured with the shapes of Qwen3-VL-2B.
+
+VOCAB = 64
+SEQ_LEN = 24
+TARGET_MODULES = ["q_proj", "v_proj", "k_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+# LoRA target shapes (out, in) of one Qwen3-VL-2B decoder layer
+REAL_LAYERS = 28
+REAL_SHAPES = {
+    "q_proj": (2048, 2048), "k_proj": (1024, 2048), "v_proj": (1024, 2048), "o_proj": (2048, 2048),
+    "gate_proj": (6144, 2048), "up_proj": (6144, 2048), "down_proj": (2048, 6144),
+}
+REAL_LORA_R = 16
+CAPTION = "A glass of water is sitting quietly where a plant should be, in an empty gallery room."
+
+
+class ToyBlock(nn.Module):
+    def __init__(self, dim):
+        super().__init__()
+        self.q_proj = nn.Linear(dim, dim)
+        self.k_proj = nn.Linear(dim, dim)
+        self.v_proj = nn.Linear(dim, dim)
+        self.o_proj = nn.Linear(dim, dim)
+        self.gate_proj = nn.Linear(dim, 4*dim)
+        self.up_proj = nn.Linear(dim, 4*dim)
+        self.down_proj = nn.Linear(4*dim, dim)
+
+    def forward(self, x):
+        attn = F.scaled_dot_product_attention(self.q_proj(x), self.k_proj(x), self.v_proj(x), is_causal=True)
+        x = x + self.o_proj(attn)
+        return x + self.down_proj(F.silu(self.gate_proj(x)) * self.up_proj(x))
+
+
+class ToyLM(nn.Module):
+    def __init__(self, dim=64, n_layers=2):
+        super().__init__()
+        self.embed = nn.Embedding(VOCAB, dim)
+        self.layers = nn.ModuleList([ToyBlock(dim) for _ in range(n_layers)])
+        self.head = nn.Linear(dim, VOCAB)
+
+    def forward(self, ids):
+        x = self.embed(ids)
+        for layer in self.layers:
+            x = layer(x)
+        return self.head(x)
+
+
+def build_model(rank, dim, n_layers):
+    torch.manual_seed(0) # same pretrained base on every node...
+    base = ToyLM(dim, n_layers)
+    torch.manual_seed(1000 + rank) # ...but an independently initialised adapter, as on the devices
+    return get_peft_model(base, LoraConfig(r=16, lora_alpha=32, target_modules=TARGET_MODULES, lora_dropout=0.05))
+
+
+def node_style(rank):
+    g = torch.Generator().manual_seed(100 + rank)
+    return torch.softmax(4 * torch.randn(VOCAB, VOCAB, generator=g), dim=-1) # bigram transition matrix
+
+def sample_caption(style, seed):
+    g = torch.Generator().manual_seed(seed)
+    ids = [int(torch.randint(VOCAB, (1,), generator=g))]
+    for _ in range(SEQ_LEN - 1):
+        ids.append(int(torch.multinomial(style[ids[-1]], 1, generator=g)))
+    return torch.tensor([ids])
+
+
+def camera_jpeg(path, max_side=256):
+    # same size/quality as JetsonCamera._process_and_encode
+    img = cv2.imread(path)
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / float(max(h, w)))
+    img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), 85])[1].tobytes()
+
+
+def finetune(model, ids, nb_steps, lr):
+    # mirrors VLMTrainer.finetune: fresh AdamW per sample, nb_steps steps
+    model.train()
+    optimizer = torch.optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=lr)
+    for _ in range(nb_steps):
+        optimizer.zero_grad()
+        logits = model(ids[:, :-1])
+        loss = F.cross_entropy(logits.reshape(-1, VOCAB), ids[:, 1:].reshape(-1))
+        loss.backward()
+        optimizer.step()
+    return loss.item()
+
+
+def eval_loss(model, styles):
+    model.eval()
+    with torch.no_grad():
+        losses = []
+        for i, style in enumerate(styles):
+            for k in range(4):
+                ids = sample_caption(style, 10**6 + 100*i + k)
+                logits = model(ids[:, :-1])
+                losses.append(F.cross_entropy(logits.reshape(-1, VOCAB), ids[:, 1:].reshape(-1)).item())
+    return sum(losses) / len(losses)
+
+
+def run_node(rank, args, mode, barrier, inboxes, results):
+    torch.set_num_threads(1)
+    model = build_model(rank, args.dim, args.layers)
+    styles = [node_style(i) for i in range(args.nodes)]
+    net = lieslm.JetsonP2PNet([])
+    jpeg = camera_jpeg(args.image)
+
+    exchange = None
+    if mode == "federated":
+        exchange = LoraDeltaExchange(model, dtype=args.dtype, topk=args.topk, rank=args.rank, weighting=args.weighting)
+
+    stats = {"train_seconds": 0.0, "train_samples": 0, "bytes_sent": 0, "bytes_received": 0, "merge_seconds": 0.0}
+
+    def train(ids):
+        t = time.perf_counter()
+        finetune(model, ids, args.steps, args.lr)
+        stats["train_seconds"] += time.perf_counter() - t
+        stats["train_samples"] += 1
+
+    for r in range(args.rounds):
+        ids = sample_caption(styles[rank], 1000*rank + r)
+
+        if mode == "samples":
+            message = (ids, len(net.pack_message({"description": CAPTION}, jpeg)))
+        else:
+            train(ids)
+            exchange.note_trained()
+            message = (None, 0)
+            if (r + 1) % args.exchange_every == 0:
+                blob = exchange.make_delta()
+                if blob:
+                    message = (blob, len(net.pack_message({"kind": "lora_delta"}, blob)))
+
+        for peer in range(args.nodes):
+            if peer != rank:
+                inboxes[peer].put((rank, message))
+                stats["bytes_sent"] += message[1]
+        barrier.wait()
+
+        for _ in range(args.nodes - 1):
+            peer, (payload, size) = inboxes[rank].get()
+            stats["bytes_received"] += size
+            if payload is None:
+                continue
+            if mode == "samples":
+                train(payload)
+            else:
+                exchange.receive(payload, str(peer))
+        if exchange:
+            exchange.merge()
+        barrier.wait()
+
+    if exchange:
+        stats["merge_seconds"] = exchange.report()["merge_seconds"]
+    stats["eval_loss"] = eval_loss(model, styles)
+    results.put((rank, stats))
+
+
+def real_model_costs(args):
+    # (bytes of one delta, seconds of one merge) for the on-device model
+    torch.manual_seed(0)
+    rank = args.rank or REAL_LORA_R
+    delta = {}
+    for i in range(REAL_LAYERS):
+        for name, (out, inp) in REAL_SHAPES.items():
+            delta[f"layers.{i}.{name}.L"] = torch.randn(out, rank)
+            delta[f"layers.{i}.{name}.R"] = torch.randn(rank, inp)
+    blob = encode_delta(delta, dtype=args.dtype, topk=args.topk, meta={"samples": args.exchange_every})
+
+    # a merge re-factors adapter + own training + every peer delta, per layer;
+    # one decoder layer is timed and scaled to the whole model
+    width = REAL_LORA_R + 2*REAL_LORA_R + (args.nodes - 1) * rank
+    t = time.perf_counter()
+    for out, inp in REAL_SHAPES.values():
+        lowrank(torch.randn(out, width), torch.randn(width, inp), REAL_LORA_R)
+    return len(blob), (time.perf_counter() - t) * REAL_LAYERS
+
+
+def simulate(args, mode):
+    barrier = mp.Barrier(args.nodes)
+    inboxes = [mp.Queue() for _ in range(args.nodes)]
+    results = mp.Queue()
+    procs = [mp.Process(target=run_node, args=(rank, args, mode, barrier, inboxes, results)) for rank in range(args.nodes)]
+    for p in procs:
+        p.start()
+    per_node = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    total = {}
+    for _, stats in per_node:
+        for key, value in stats.items():
+            total[key] = total.get(key, 0) + value
+    total["eval_loss"] /= args.nodes
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process CPU simulation: per-sample retraining vs federated LoRA deltas")
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=1)
+    parser.add_argument("--lr", type=float, default=5e-4)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--exchange-every", type=int, default=4)
+    parser.add_argument("--dtype", default="int8", choices=["fp32", "fp16", "int8"])
+    parser.add_argument("--topk", type=float, default=1.0)
+    parser.add_argument("--rank", type=int, default=8, help="rank of the shipped weight deltas (main.py FED_RANK)")
+    parser.add_argument("--weighting", default="fedavg", choices=["fedavg", "trust"])
+    parser.add_argument("--image", default="test.jpg", help="jpeg sent with each caption in 'samples' mode")
+    parser.add_argument("--sample-seconds", type=float, default=10.0, help="on-device fine-tuning time per sample (main.py prior)")
+    args = parser.parse_args()
+
+    print(f"{BLUE}[*] Simulating {args.nodes} nodes for {args.rounds} rounds...{RESET}")
+    rows = {mode: simulate(args, mode) for mode in ("samples", "federated")}
+
+    print(f"\n{'mode':<10} {'train s':>9} {'samples':>8} {'MB sent':>9} {'merge s':>8} {'eval loss':>10}")
+    for mode, t in rows.items():
+        print(f"{mode:<10} {t['train_seconds']:>9.2f} {t['train_samples']:>8} "
+              f"{t['bytes_sent']/1e6:>9.3f} {t['merge_seconds']:>8.3f} {t['eval_loss']:>10.4f}")
+
+    base, fed = rows["samples"], rows["federated"]
+    saved = base["train_seconds"] - fed["train_seconds"] - fed["merge_seconds"]
+    print(f"\n[+] Toy model: federated saves {saved:.2f} compute-seconds "
+          f"({100*saved/max(base['train_seconds'], 1e-9):.0f}%) and sends "
+          f"{fed['bytes_sent']/max(base['bytes_sent'], 1):.2f}x the bytes of per-sample exchange "
+          f"(toy layers, not representative of the real traffic)")
+
+    # per node and per displayed caption, on the device
+    delta_bytes, merge_seconds = real_model_costs(args)
+    frame_bytes = len(lieslm.JetsonP2PNet([]).pack_message({"description": CAPTION}, camera_jpeg(args.image)))
+    samples_bytes = frame_bytes
+    fed_bytes = delta_bytes / args.exchange_every
+    samples_gpu = (args.nodes - 1) * args.sample_seconds
+    fed_gpu = args.sample_seconds + merge_seconds / args.exchange_every
+    print(f"\n{BLUE}[*] Qwen3-VL-2B shapes ({REAL_LAYERS} layers, rank {args.rank or REAL_LORA_R}, "
+          f"{args.dtype}, topk {args.topk}): one delta is {delta_bytes/1e6:.2f} MB, "
+          f"one frame + caption {frame_bytes/1e3:.1f} kB, one merge {merge_seconds:.2f}s on this CPU{RESET}")
+    print(f"{GREEN}[+] Per caption and per peer link: per-sample exchange sends {samples_bytes/1e3:.1f} kB, "
+          f"federated {fed_bytes/1e3:.1f} kB ({fed_bytes/samples_bytes:.0f}x); "
+          f"training per caption: {samples_gpu:.0f}s vs {fed_gpu:.1f}s "
+          f"(at {args.sample_seconds:.0f}s per sample){RESET}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,11 @@
-from .vlm import VLMTrainer
+from .vlm import VLMTrainer, VLM_CONFIG
 from .p2p import JetsonP2PNet
 from .img import JetsonCamera
 from .esp import create_hyphenated_epaper_image, send_png_to_esp,send_pulse_command,send_png_to_esp,drain_lines, img_to_gxepd_bytes
 from .led import blink_led, clean_led
+from .sched import CycleScheduler
+from .scene import SceneGate
+from .fed import LoraDeltaExchange
+from .server import ModelServer, ModelClient, RemoteDeltaExchange, socket_path_for
 
-__all__ = ['VLMTrainer', 'JetsonP2PNet', 'create_hyphenated_epaper_image', 'send_png_to_esp', 'send_pulse_command', 'img_to_gxepd_bytes', 'send_png_to_esp','drain_lines','blink_led', 'clean_led']
+__all__ = ['VLMTrainer', 'VLM_CONFIG', 'JetsonP2PNet', 'create_hyphenated_epaper_image', 'send_png_to_esp', 'send_pulse_command', 'img_to_gxepd_bytes', 'send_png_to_esp','drain_lines','blink_led', 'clean_led', 'CycleScheduler', 'SceneGate', 'LoraDeltaExchange', 'ModelServer', 'ModelClient', 'RemoteDeltaExchange', 'socket_path_for']
@@ -0,0 +1,296 @@
+import json
+import struct
+import threading
+import time
+import numpy as np
+import torch
+
+
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+DTYPES = ("fp32", "fp16", "int8")
+
+
+def lora_layers(model):
+    # {module name: (lora_A weight, lora_B weight, scaling)} for every peft
+    # LoRA layer, the effective weight change of a layer is scaling * B @ A
+    layers = {}
+    for name, module in model.named_modules():
+        lora_A = getattr(module, "lora_A", None)
+        if isinstance(lora_A, torch.nn.ModuleDict) and "default" in lora_A:
+            layers[name] = (lora_A["default"].weight, module.lora_B["default"].weight, module.scaling["default"])
+    return layers
+
+
+def lowrank(P, Q, rank):
+    # truncated SVD of P @ Q without forming it: returns (L, R, S) with
+    # L @ R the best rank-`rank` approximation, R with orthonormal rows
+    # and the singular values S carried by L
+    Qp, Rp = torch.linalg.qr(P)
+    Qq, Rq = torch.linalg.qr(Q.T)
+    U, S, Vh = torch.linalg.svd(Rp @ Rq.T)
+    k = min(rank, S.numel())
+    L = Qp @ (U[:, :k] * S[:k])
+    R = Vh[:k] @ Qq.T
+    return L, R, S[:k]
+
+
+def encode_delta(delta, dtype="int8", topk=1.0, meta=None):
+    # Blob layout: [HeaderSize(4b)] + [JSON header] + [tensor buffers]
+    # Each tensor is optionally sparsified (top-k by magnitude, indices as
+    # uint32) then stored as fp32, fp16 or symmetric per-tensor int8.
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported delta dtype: {dtype}")
+
+    entries = []
+    buffers = []
+    for name, tensor in delta.items():
+        flat = tensor.detach().float().cpu().numpy().ravel()
+        entry = {"name": name, "shape": list(tensor.shape), "dtype": dtype, "sparse": False, "scale": 1.0}
+
+        if topk < 1.0:
+            k = max(1, int(flat.size * topk))
+            idx = np.sort(np.argpartition(np.abs(flat), -k)[-k:]).astype(np.uint32)
+            values = flat[idx]
+            entry["sparse"] = True
+            entry["k"] = int(k)
+            buffers.append(idx.tobytes())
+        else:
+            values = flat
+
+        if dtype == "fp16":
+            values = values.astype(np.float16)
+        elif dtype == "int8":
+            peak = float(np.max(np.abs(values))) if values.size else 0.0
+            scale = peak / 127.0 if peak > 0 else 1.0
+            values = np.clip(np.round(values / scale), -127, 127).astype(np.int8)
+            entry["scale"] = scale
+        else:
+            values = values.astype(np.float32)
+
+        buffers.append(values.tobytes())
+        entries.append(entry)
+
+    header = json.dumps({"meta": meta or {}, "tensors": entries}).encode("utf-8")
+    return struct.pack("!I", len(header)) + header + b"".join(buffers)
+
+
+def decode_delta(blob):
+    header_len = struct.unpack("!I", blob[:4])[0]
+    header = json.loads(blob[4:4+header_len].decode("utf-8"))
+    view = memoryview(blob)
+    offset = 4 + header_len
+    np_dtypes = {"fp32": np.float32, "fp16": np.float16, "int8": np.int8}
+
+    delta = {}
+    for entry in header["tensors"]:
+        numel = int(np.prod(entry["shape"])) if entry["shape"] else 1
+        count = entry["k"] if entry["sparse"] else numel
+        if entry["sparse"]:
+            idx = np.frombuffer(view[offset:offset + 4*count], dtype=np.uint32)
+            offset += 4*count
+        value_dtype = np_dtypes[entry["dtype"]]
+        nbytes = count * np.dtype(value_dtype).itemsize
+        values = np.frombuffer(view[offset:offset + nbytes], dtype=value_dtype).astype(np.float32)
+        offset += nbytes
+        values *= entry["scale"]
+
+        if entry["sparse"]:
+            flat = np.zeros(numel, dtype=np.float32)
+            flat[idx] = values
+        else:
+            flat = values
+        delta[entry["name"]] = torch.from_numpy(flat.reshape(entry["shape"]).copy())
+    return delta, header["meta"]
+
+
+class LoraDeltaExchange:
+    # Federated alternative to retraining on every peer's raw samples: the
+    # node trains on its own captions, periodically ships the weight change
+    # of its adapter and merges the changes received from peers.
+    #
+    # Deltas live in weight space (dW = scaling * B @ A of each LoRA layer)
+    # and are shipped as rank-`rank` factors L @ R. The LoRA factors
+    # themselves are never added across nodes: every device has its own,
+    # independently initialised A/B, so only their product means the same
+    # thing everywhere. A merge re-factors the merged product into this
+    # node's A/B, and a delta is skipped for layers whose shape differs.
+    #
+    # `unsent` is the own training not shipped yet. What is actually
+    # shipped (after truncation / quantization / top-k) is subtracted from
+    # it, so what was dropped goes out with the next delta (error feedback).
+    # The accumulators are kept at rank <= 2r, so once the quantization /
+    # top-k residuals pile up past that the feedback is only approximate.
+    # `since_merge` is the own training since the last merge, it is the
+    # node's own term of the weighted average. Merged peer deltas go in
+    # neither, so they are never echoed back.
+    #
+    # Merge: W <- W_merge + w_self * own + sum(w_peer * peer), the weights
+    # summing to 1.
+    # weighting="fedavg": every term is weighted by its share of the samples
+    #   trained on by everyone (own + peers) since the last merge.
+    # weighting="trust": self_trust for the own term, trust[peer_ip]
+    #   (default_trust for unknown peers) for the others, normalised.
+    def __init__(self, model, dtype="int8", topk=1.0, rank=None, weighting="fedavg", trust=None,
+                 default_trust=0.5, self_trust=1.0):
+        if weighting not in ("fedavg", "trust"):
+            raise ValueError(f"Unsupported weighting: {weighting}")
+        self.model = model
+        self.dtype = dtype
+        self.topk = topk
+        self.weighting = weighting
+        self.trust = trust or {}
+        self.default_trust = default_trust
+        self.self_trust = self_trust
+
+        self.layers = lora_layers(model)
+        if not self.layers:
+            raise ValueError("No LoRA layers found in model")
+        adapter_rank = max(A.shape[0] for A, _, _ in self.layers.values())
+        self.rank = rank or adapter_rank
+        self.max_rank = 2 * adapter_rank # cap of the own-training accumulators
+
+        self.reference = self._snapshot()
+        self.unsent = {}
+        self.since_merge = {}
+        self.unsent_samples = 0
+        self.unmerged_samples = 0
+        self.inbox = []
+        self.inbox_lock = threading.Lock()
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.deltas_merged = 0
+        self.merge_seconds = 0.0
+
+    def _snapshot(self):
+        return {name: (A.detach().float().cpu().clone(), B.detach().float().cpu().clone())
+                for name, (A, B, _) in self.layers.items()}
+
+    def _accumulate(self, acc, name, L, R):
+        # acc[name] <- acc[name] + L @ R, kept as factors of rank <= max_rank
+        if name in acc:
+            L = torch.cat([acc[name][0], L], dim=1)
+            R = torch.cat([acc[name][1], R], dim=0)
+        L, R, _ = lowrank(L, R, self.max_rank)
+        acc[name] = (L, R)
+
+    def _bank(self):
+        # move the own training since the last call into the accumulators
+        current = self._snapshot()
+        for name, (A, B, scaling) in self.layers.items():
+            A_ref, B_ref = self.reference[name]
+            A_new, B_new = current[name]
+            L = torch.cat([scaling * B_new, -scaling * B_ref], dim=1)
+            R = torch.cat([A_new, A_ref], dim=0)
+            self._accumulate(self.unsent, name, L, R)
+            self._accumulate(self.since_merge, name, L, R)
+        self.reference = current
+
+    def note_trained(self, nb_samples=1):
+        self.unsent_samples += nb_samples
+        self.unmerged_samples += nb_samples
+
+    def make_delta(self):
+        if not self.unsent_samples:
+            return None
+        self._bank()
+        delta = {}
+        for name, (L, R) in self.unsent.items():
+            L, R, _ = lowrank(L, R, self.rank)
+            delta[name + ".L"] = L
+            delta[name + ".R"] = R
+        blob = encode_delta(delta, dtype=self.dtype, topk=self.topk, meta={"samples": self.unsent_samples})
+
+        sent, _ = decode_delta(blob)
+        for name in self.unsent:
+            self._accumulate(self.unsent, name, -sent[name + ".L"], sent[name + ".R"])
+        self.unsent_samples = 0
+        self.bytes_sent += len(blob)
+        return blob
+
+    def receive(self, blob, peer_ip): # called from the P2P receiver thread
+        with self.inbox_lock:
+            self.inbox.append((peer_ip, blob))
+            self.bytes_received += len(blob)
+
+    def pending(self):
+        with self.inbox_lock:
+            return len(self.inbox)
+
+    def _weights(self, received):
+        # (own weight, [peer weights]), summing to 1
+        if self.weighting == "trust":
+            raw = [self.self_trust] + [self.trust.get(ip, self.default_trust) for ip, _, _ in received]
+        else:
+            raw = [self.unmerged_samples] + [meta.get("samples", 1) for _, _, meta in received]
+        total = sum(raw)
+        if total <= 0:
+            return 1.0, [0.0] * len(received)
+        return raw[0] / total, [w / total for w in raw[1:]]
+
+    def merge(self):
+        with self.inbox_lock:
+            inbox, self.inbox = self.inbox, []
+        if not inbox:
+            return 0
+
+        t = time.monotonic()
+        received = []
+        for peer_ip, blob in inbox:
+            try:
+                delta, meta = decode_delta(blob)
+            except Exception as e:
+                print(f"{YELLOW}[!] Dropping malformed delta from {peer_ip}: {e}{RESET}")
+                continue
+            received.append((peer_ip, delta, meta))
+        if not received:
+            return 0
+
+        self._bank()
+        self_weight, peer_weights = self._weights(received)
+        with torch.no_grad():
+            for name, (A, B, scaling) in self.layers.items():
+                A_cur, B_cur = self.reference[name]
+                # merged weight change, as factors P @ Q, in units of B @ A
+                P, Q = [B_cur], [A_cur]
+                if name in self.since_merge:
+                    L, R = self.since_merge[name]
+                    P.append((self_weight - 1.0) / scaling * L)
+                    Q.append(R)
+                for (_, delta, _), weight in zip(received, peer_weights):
+                    L, R = delta.get(name + ".L"), delta.get(name + ".R")
+                    if L is None or R is None or L.shape[0] != B.shape[0] or R.shape[1] != A.shape[1]:
+                        continue
+                    P.append(weight / scaling * L)
+                    Q.append(R)
+
+                L, R, S = lowrank(torch.cat(P, dim=1), torch.cat(Q, dim=0), A.shape[0])
+                # A keeps the row norm it had (its init scale) so the learning
+                # dynamics of the adapter don't change. Directions the merge
+                # leaves empty keep their old A row and get a zero B column,
+                # so that they can still be trained.
+                A_new, B_new = A_cur.clone(), torch.zeros_like(B_cur)
+                k = S.numel()
+                norm = A_cur.norm(dim=1).mean().clamp_min(1e-8)
+                live = S > S.max() * 1e-6
+                A_new[:k][live] = norm * R[live]
+                B_new[:, :k][:, live] = L[:, live] / norm
+                A.copy_(A_new.to(A.device, A.dtype))
+                B.copy_(B_new.to(B.device, B.dtype))
+
+        self.reference = self._snapshot()
+        self.since_merge = {}
+        self.unmerged_samples = 0
+        self.deltas_merged += len(received)
+        self.merge_seconds += time.monotonic() - t
+        return len(received)
+
+    def report(self):
+        return {
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "deltas_merged": self.deltas_merged,
+            "merge_seconds": self.merge_seconds,
+        }
@@ -12,6 +12,12 @@ class JetsonCamera:
     
     def __init__(self, max_side=256, sensor_id=0):
         self.max_side = max_side
+        self.sensor_id = sensor_id
+        self.cap = None
+        self.open_stream()
+
+    def open_stream(self):
+        sensor_id = self.sensor_id
         # Silence camera driver output logs : redirect stderr to /dev/null
         time.sleep(5)
         stderr_fd = sys.stderr.fileno()
@@ -32,6 +38,12 @@ class JetsonCamera:
             print(f"{RED}Error: Could not initialize camera stream.{RESET}")
         else:
             print(f"{GREEN}Correctly initialized camera stream.{RESET}")
+        return self.cap.isOpened()
+
+    def reopen(self): # recover from a stalled nvargus pipeline without restarting the process
+        if self.cap is not None:
+            self.cap.release()
+        return self.open_stream()
                 
     def _get_gstreamer_pipeline(self, sensor_id=0, width=640, height=480, fps=30):
         return (
@@ -81,7 +93,7 @@ class JetsonCamera:
 
     def __del__(self):
         # Clean up when the object is destroyed
-        if hasattr(self, 'cap') and self.cap.isOpened():
+        if getattr(self, 'cap', None) is not None and self.cap.isOpened():
             self.cap.release()
 
     def load_test_image(self, file_path="test.jpg"):
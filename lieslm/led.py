@@ -1,15 +1,26 @@
-import Jetson.GPIO as GPIO
 import warnings
-# Avoid warnings from GPIO:
-GPIO.setwarnings(False)
-warnings.filterwarnings("ignore", message="Could not open /dev/mem")
 import time
 
 BLUE = "\033[94m"
 RESET = "\033[0m"
 
+_GPIO = None
+
+def _gpio():
+    # Jetson.GPIO is imported on first use so that the package also loads
+    # off-Jetson (fed_sim.py, bench_vlm.py)
+    global _GPIO
+    if _GPIO is None:
+        import Jetson.GPIO as GPIO
+        # Avoid warnings from GPIO:
+        GPIO.setwarnings(False)
+        warnings.filterwarnings("ignore", message="Could not open /dev/mem")
+        _GPIO = GPIO
+    return _GPIO
+
 
 def blink_led(duration_seconds, pin=7): #pin 7 is "aud" in Nvidia's world 
+    GPIO = _gpio()
     GPIO.setmode(GPIO.BOARD)
     GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
     start_time = time.time()
@@ -28,6 +39,7 @@ def blink_led(duration_seconds, pin=7): #pin 7 is "aud" in Nvidia's world
         GPIO.output(pin, GPIO.HIGH)
 
 def clean_led(pin=7):
+    GPIO = _gpio()
     GPIO.output(pin, GPIO.LOW)
     GPIO.cleanup()
 
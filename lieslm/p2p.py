@@ -12,6 +12,8 @@ MAGENTA = "\033[95m"
 CYAN = "\033[96m"
 RESET = "\033[0m"
 
+MIN_LINK_RATE = 0.25e6 # worst-case bytes/s on the shared Wi-Fi link, sets the send timeouts
+
 
 class JetsonP2PNet:
     
@@ -19,6 +21,10 @@ class JetsonP2PNet:
         self.header_struct = struct.Struct("!Q")  # 8-byte size header
         self.my_port = my_port
         self.on_data_callback = None
+        self.on_delta_callback = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.stats_lock = threading.Lock() # receiver threads update bytes_received concurrently
         
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
@@ -30,21 +36,39 @@ class JetsonP2PNet:
             s.close()
         self.peers = [p for p in peers_list if p != local_ip]
 
-    def broadcast_data(self, description, image_bytes):
-        metadata = json.dumps({"description": description}).encode('utf-8')
+    def pack_message(self, metadata, body):
+        metadata = json.dumps(metadata).encode('utf-8')
         metadata_size = len(metadata)
         
-        # Total payload: [MetaSize(4b)] + [Meta] + [Image]
-        payload = struct.pack("!I", metadata_size) + metadata + image_bytes
-        full_package = self.header_struct.pack(len(payload)) + payload
+        # Total payload: [MetaSize(4b)] + [Meta] + [Body]
+        payload = struct.pack("!I", metadata_size) + metadata + body
+        return self.header_struct.pack(len(payload)) + payload
+
+    def _broadcast(self, full_package, sequential=False):
+        # small messages go to every peer in parallel; large ones (LoRA
+        # deltas) one peer after another from a single thread, so that each
+        # transfer gets the whole link and its timeout holds
+        if sequential:
+            def _send_all():
+                for peer_ip in self.peers:
+                    self._send_to_peer(peer_ip, full_package)
+            threading.Thread(target=_send_all, daemon=True).start()
+        else:
+            for peer_ip in self.peers:
+                threading.Thread(target=self._send_to_peer, args=(peer_ip, full_package)).start()
+        with self.stats_lock:
+            self.bytes_sent += len(full_package) * len(self.peers)
+
+    def broadcast_data(self, description, image_bytes):
+        self._broadcast(self.pack_message({"description": description}, image_bytes))
 
-        for peer_ip in self.peers:
-            threading.Thread(target=self._send_to_peer, args=(peer_ip, full_package)).start()
+    def broadcast_delta(self, delta_bytes):
+        self._broadcast(self.pack_message({"kind": "lora_delta"}, delta_bytes), sequential=True)
 
     def _send_to_peer(self, ip, data):
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(5)
+                s.settimeout(max(5, len(data) / MIN_LINK_RATE)) # whole sendall, not per packet
                 s.connect((ip, self.my_port))
                 s.sendall(data)
         except Exception as e:
@@ -70,16 +94,22 @@ class JetsonP2PNet:
             if not raw_size: return
             payload_size = self.header_struct.unpack(raw_size)[0]
 
-            data = b""
+            data = bytearray()
             while len(data) < payload_size:
-                packet = conn.recv(4096)
+                packet = conn.recv(65536)
                 if not packet: break
                 data += packet
+            with self.stats_lock:
+                self.bytes_received += 8 + len(data)
 
             meta_len = struct.unpack("!I", data[:4])[0]
             metadata = json.loads(data[4:4+meta_len].decode('utf-8'))
-            image_data = data[4+meta_len:]
+            body = bytes(data[4+meta_len:])
             
-            if self.on_data_callback:
-                self.on_data_callback(metadata['description'], image_data, addr[0])
+            if metadata.get("kind") == "lora_delta":
+                if self.on_delta_callback:
+                    self.on_delta_callback(body, addr[0])
+                    print(f"{BLUE}Received LoRA delta from {addr[0]} ({len(body)} bytes){RESET}")
+            elif self.on_data_callback:
+                self.on_data_callback(metadata['description'], body, addr[0])
                 print(f"{BLUE}Received from {addr[0]}: {metadata['description']}{RESET}")
@@ -0,0 +1,133 @@
+import time
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+
+def frame_signature(image_bytes, thumb_side=32):
+    # cheap grayscale thumbnail + 64-bit difference hash of a JPEG frame
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    gray = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if gray is None:
+        return None, None
+    thumb = cv2.resize(gray, (thumb_side, thumb_side), interpolation=cv2.INTER_AREA)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    dhash = 0
+    for b in bits:
+        dhash = (dhash << 1) | int(b)
+    return thumb, dhash
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class CaptionCache:
+    # bounded LRU keyed by (frame hash, adapter version), each entry keeps a
+    # few caption variants so a reused caption doesn't always read the same.
+    # An entry stays valid for `max_age` adapter versions (saves) after the
+    # one that produced it, so training every cycle doesn't void the cache.
+    def __init__(self, max_entries=32, max_variants=3, max_distance=4, max_age=4):
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.entries = OrderedDict()
+
+    def _find(self, dhash, version, max_age=0):
+        # closest hash first, then the most recent adapter version
+        best, best_rank = None, (self.max_distance + 1, 0)
+        for key in self.entries:
+            if not 0 <= version - key[1] <= max_age:
+                continue
+            rank = (hamming(key[0], dhash), version - key[1])
+            if rank < best_rank:
+                best, best_rank = key, rank
+        return best
+
+    def get(self, dhash, version, avoid=None):
+        key = self._find(dhash, version, self.max_age)
+        if key is None:
+            return None
+        self.entries.move_to_end(key)
+        variants = self.entries[key]
+        # least recently shown variant first, skip what is on screen now
+        for i, caption in enumerate(variants):
+            if caption != avoid or i == len(variants) - 1:
+                variants.append(variants.pop(i))
+                return caption
+
+    def put(self, dhash, version, caption):
+        key = self._find(dhash, version) or (dhash, version)
+        variants = self.entries.setdefault(key, [])
+        if caption in variants:
+            variants.remove(caption)
+        variants.append(caption)
+        del variants[:-self.max_variants]
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class SceneGate:
+    # Skips VLM inference while the camera sees the same scene: a frame is
+    # "static" when its thumbnail differs from the last inferred frame by
+    # less than `threshold` (mean abs difference, 0..1). Inference is still
+    # forced every `min_refresh` seconds.
+    def __init__(self, threshold=0.03, min_refresh=5*60, cache_size=32, cache_variants=3, cache_max_age=4):
+        self.threshold = threshold
+        self.min_refresh = min_refresh
+        self.cache = CaptionCache(max_entries=cache_size, max_variants=cache_variants, max_age=cache_max_age)
+
+        self.ref_thumb = None
+        self.last_inference = None
+        self.last_caption = None
+        self.inference_time = 0.0
+        self.inference_count = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, image_bytes, adapter_version):
+        # returns (caption or None, signature); caption is None when inference must run
+        thumb, dhash = frame_signature(image_bytes)
+        signature = (thumb, dhash)
+        if thumb is None or self.ref_thumb is None:
+            self.misses += 1
+            return None, signature
+
+        diff = float(np.mean(cv2.absdiff(thumb, self.ref_thumb))) / 255.0
+        due = time.monotonic() - self.last_inference >= self.min_refresh
+        caption = None
+        if diff < self.threshold and not due:
+            caption = self.cache.get(dhash, adapter_version, avoid=self.last_caption)
+
+        if caption is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.saved_seconds += self.inference_time / max(1, self.inference_count)
+            self.last_caption = caption
+        return caption, signature
+
+    def store(self, signature, adapter_version, caption, inference_seconds):
+        thumb, dhash = signature
+        self.inference_time += inference_seconds
+        self.inference_count += 1
+        self.last_inference = time.monotonic()
+        self.last_caption = caption
+        if thumb is None:
+            return
+        self.ref_thumb = thumb
+        self.cache.put(dhash, adapter_version, caption)
+
+    def report(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
@@ -0,0 +1,176 @@
+import time
+import math
+from collections import deque
+from contextlib import contextmanager
+
+YELLOW = "\033[93m"
+RESET = "\033[0m"
+
+
+class StageCost:
+    # EWMA of a stage duration plus an EWMA of its absolute deviation
+    # (same idea as TCP's srtt/rttvar), so estimates stay pessimistic enough
+    # to hold a deadline when a stage is noisy.
+    def __init__(self, prior=0.0, alpha=0.3):
+        self.alpha = alpha
+        self.mean = prior
+        self.dev = 0.0
+        self.last = None
+        self.count = 0
+
+    def update(self, seconds):
+        self.last = seconds
+        if self.count == 0:
+            # first real measurement replaces the prior, the deviation
+            # only grows once there is a second one to compare with
+            self.mean = seconds
+            self.dev = 0.0
+        else:
+            err = seconds - self.mean
+            self.mean += self.alpha * err
+            self.dev += self.alpha * (abs(err) - self.dev)
+        self.count += 1
+
+    def estimate(self, dev_gain=1.0):
+        return self.mean + dev_gain * self.dev
+
+
+class CycleScheduler:
+    # The display update is the hard deadline: deadline k = t0 + k * period.
+    # Everything before the display (capture, inference, render, serial) is
+    # started just late enough to land on the deadline, and the slack left
+    # until the next cycle start is handed out to training. Anything that
+    # can overlap with that slack (e.g. the LED lead-in) is not budgeted here.
+    # Inference always stays budgeted, even when it is often skipped: a
+    # scene change must not make the caption late.
+
+    PRE_DISPLAY_STAGES = ("capture", "inference", "render", "serial")
+
+    def __init__(self, period, margin=1.0, alpha=0.3, dev_gain=1.0, priors=None, max_starve_cycles=10, window=100):
+        self.period = period
+        self.margin = margin
+        self.alpha = alpha
+        self.dev_gain = dev_gain
+        self.max_starve_cycles = max_starve_cycles
+        self.costs = {}
+        for stage, prior in (priors or {}).items():
+            self.costs[stage] = StageCost(prior, alpha)
+
+        self.t0 = None
+        self.cycle = 0
+        self.starved = 0
+        self.missed = 0
+        self.displayed = 0
+        self.last_display = None
+        # timing stats over the last `window` displays only, so that the
+        # report follows current behaviour on an installation running for weeks
+        self.lateness = deque(maxlen=window)
+        self.periods = deque(maxlen=window)
+
+    def start(self, first_deadline_in=None):
+        if first_deadline_in is None:
+            first_deadline_in = self.pre_display_cost()
+        self.t0 = time.monotonic() + first_deadline_in
+        self.cycle = 0
+
+    def _cost(self, stage):
+        if stage not in self.costs:
+            self.costs[stage] = StageCost(0.0, self.alpha)
+        return self.costs[stage]
+
+    def record(self, stage, seconds):
+        self._cost(stage).update(seconds)
+
+    def estimate(self, stage):
+        return self._cost(stage).estimate(self.dev_gain)
+
+    @contextmanager
+    def measure(self, stage):
+        t = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - t)
+
+    def pre_display_cost(self):
+        return sum(self.estimate(s) for s in self.PRE_DISPLAY_STAGES) + self.margin
+
+    def deadline(self, cycle=None):
+        return self.t0 + (self.cycle if cycle is None else cycle) * self.period
+
+    def cycle_start(self, cycle=None):
+        return self.deadline(cycle) - self.pre_display_cost()
+
+    def send_at(self):
+        # start the serial transfer so that the ESP is done at the deadline
+        return self.deadline() - self.estimate("serial")
+
+    def wait_until(self, t):
+        delay = t - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def training_budget(self, until=None):
+        # slack between now and the start of the next cycle (called after
+        # mark_display, so self.cycle is already the next one), or until
+        # `until` for a window inside the cycle (e.g. a skipped inference)
+        if until is None:
+            until = self.cycle_start()
+        return until - time.monotonic()
+
+    def plan_training(self, n_available, stage="train_sample", reserve=("save",), until=None):
+        # how many samples fit in the slack before `until` (default: next cycle start)
+        if n_available <= 0:
+            self.starved = 0
+            return 0
+        budget = self.training_budget(until) - sum(self.estimate(s) for s in reserve)
+        per_sample = self.estimate(stage)
+        if per_sample <= 0:
+            n = 1 if budget > 0 else 0
+        else:
+            n = max(0, int(budget // per_sample))
+        n = min(n, n_available)
+
+        if n == 0 and until is None:
+            self.starved += 1
+            if self.starved > self.max_starve_cycles:
+                # a single sample never fits: let it overrun one deadline
+                # rather than never training at all
+                print(f"{YELLOW}[!] Training starved for {self.starved - 1} cycles, forcing one sample.{RESET}")
+                n = 1
+                self.starved = 0
+        elif n > 0:
+            self.starved = 0
+        return n
+
+    def mark_display(self):
+        now = time.monotonic()
+        late = now - self.deadline()
+        self.lateness.append(late)
+        self.displayed += 1
+        if self.last_display is not None:
+            self.periods.append(now - self.last_display)
+        self.last_display = now
+
+        # skip deadlines that can no longer be met
+        self.cycle += 1
+        while self.cycle_start() < now:
+            self.cycle += 1
+            self.missed += 1
+        return late
+
+    def report(self):
+        def _std(values):
+            if len(values) < 2:
+                return 0.0
+            m = sum(values) / len(values)
+            return math.sqrt(sum((v - m) ** 2 for v in values) / (len(values) - 1))
+
+        return {
+            "cycles": self.displayed,
+            "last_late": self.lateness[-1] if self.lateness else 0.0,
+            "max_abs_late": max((abs(v) for v in self.lateness), default=0.0),
+            "mean_period": sum(self.periods) / len(self.periods) if self.periods else 0.0,
+            "period_jitter": _std(self.periods),
+            "missed": self.missed,
+        }
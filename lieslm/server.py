@@ -0,0 +1,292 @@
+import os
+import gc
+import json
+import time
+import fcntl
+import socket
+import struct
+import threading
+import subprocess
+
+RED = "\033[91m"
+GREEN = "\033[92m"
+YELLOW = "\033[93m"
+BLUE = "\033[94m"
+RESET = "\033[0m"
+
+HEADER = struct.Struct("!Q")  # 8-byte size header, same framing as JetsonP2PNet
+
+
+def socket_path_for(nb_model):
+    return f"/tmp/lieslm_model{nb_model}.sock"
+
+
+def send_message(conn, metadata, body=b""):
+    # Total payload: [MetaSize(4b)] + [Meta] + [Body]
+    metadata = json.dumps(metadata).encode('utf-8')
+    payload = struct.pack("!I", len(metadata)) + metadata + body
+    conn.sendall(HEADER.pack(len(payload)) + payload)
+
+def _recv_exact(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        packet = conn.recv(min(65536, size - len(data)))
+        if not packet:
+            raise ConnectionError("model server connection closed")
+        data += packet
+    return data
+
+def recv_message(conn):
+    payload_size = HEADER.unpack(_recv_exact(conn, HEADER.size))[0]
+    data = _recv_exact(conn, payload_size)
+    meta_len = struct.unpack("!I", data[:4])[0]
+    metadata = json.loads(data[4:4+meta_len].decode('utf-8'))
+    return metadata, bytes(data[4+meta_len:])
+
+
+def _try_lock(lock_path, blocking=False):
+    # exclusive lock held for the whole life of the server: a second server
+    # for the same model waits for it instead of loading the weights twice
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class ModelServer:
+    # Hosts a VLMTrainer in its own long-lived process and serves inference /
+    # fine-tuning requests over a local unix socket, so that camera, serial or
+    # GPIO faults in the main process never force a model reload.
+    def __init__(self, trainer, socket_path):
+        self.trainer = trainer
+        self.socket_path = socket_path
+        self.exchange = None
+        self.started = time.monotonic()
+        self.loaded_in = None
+
+    def serve_forever(self):
+        lock_fd = _try_lock(self.socket_path + ".lock")
+        if lock_fd is None:
+            # block rather than exit: exiting would make systemd restart us in a loop
+            print(f"{YELLOW}[!] A model server is already running on {self.socket_path}, waiting for it to stop...{RESET}")
+            lock_fd = _try_lock(self.socket_path + ".lock", blocking=True)
+            if lock_fd is None:
+                raise RuntimeError(f"could not lock {self.socket_path}.lock")
+
+        print(f"{BLUE}[*] Loading vision-language model in memory...{RESET}")
+        t = time.monotonic()
+        self.trainer.load_model()
+        self._clear_vram()
+        self.loaded_in = time.monotonic() - t
+        print(f"{GREEN}[*] Model loaded in {self.loaded_in:.1f}s{RESET}")
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.bind(self.socket_path)
+            s.listen(1)
+            print(f"{GREEN}[*] Model server listening on {self.socket_path}{RESET}")
+            while True:
+                conn, _ = s.accept()
+                with conn:
+                    self._handle_client(conn)
+
+    def _handle_client(self, conn):
+        while True:
+            try:
+                request, body = recv_message(conn)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response, out = self._dispatch(request, body)
+            except Exception as e:
+                print(f"{RED}[!] {request.get('op')} failed: {e}{RESET}")
+                response, out = {"error": f"{type(e).__name__}: {e}"}, b""
+            response["adapter_version"] = self.trainer.adapter_version
+            try:
+                send_message(conn, response, out)
+            except OSError:
+                return
+
+    def _clear_vram(self):
+        import torch
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            torch.cuda.ipc_collect()
+
+    def _dispatch(self, request, body):
+        import torch
+        op = request["op"]
+
+        if op == "status":
+            return {"uptime": time.monotonic() - self.started, "loaded_in": self.loaded_in}, b""
+
+        if op == "inference":
+            with torch.no_grad():
+                result = self.trainer.run_inference(image_input=body, prompt=request["prompt"])
+            return {"result": result}, b""
+
+        if op == "finetune":
+            loss = self.trainer.finetune(
+                image_input=body,
+                adversarial_description=request["description"],
+                nb_steps=request["nb_steps"],
+                lr=request["lr"]
+            )
+            self._clear_vram()
+            return {"loss": loss}, b""
+
+        if op == "save":
+            self.trainer.save()
+            return {}, b""
+
+        if op == "fed_setup":
+            from .fed import LoraDeltaExchange
+            if self.exchange is None: # keep the reference across main restarts
+                self.exchange = LoraDeltaExchange(self.trainer.model, **request["config"])
+            return {}, b""
+
+        if self.exchange is None:
+            raise RuntimeError(f"Unknown op or federated mode not set up: {op}")
+
+        if op == "fed_note":
+            self.exchange.note_trained(request["nb_samples"])
+            return {}, b""
+        if op == "fed_receive":
+            self.exchange.receive(body, request["peer_ip"])
+            return {}, b""
+        if op == "fed_merge":
+            return {"merged": self.exchange.merge()}, b""
+        if op == "fed_make_delta":
+            blob = self.exchange.make_delta()
+            return {"empty": blob is None}, blob or b""
+        if op == "fed_report":
+            return {"report": self.exchange.report()}, b""
+
+        raise RuntimeError(f"Unknown op: {op}")
+
+
+class ModelClient:
+    # Same interface as VLMTrainer (run_inference / finetune / save /
+    # adapter_version) backed by a ModelServer process. If no server holds
+    # the lock after `spawn_after` seconds (leave time to a systemd-managed
+    # one to start), one is spawned with `spawn_cmd` in its own session;
+    # without spawn_cmd, connect() gives up then. A server holding the lock
+    # is loading the model: it is waited for up to `connect_timeout`.
+    def __init__(self, socket_path, spawn_cmd=None, spawn_after=0.0, connect_timeout=20*60):
+        self.socket_path = socket_path
+        self.spawn_cmd = spawn_cmd
+        self.spawn_after = spawn_after
+        self.connect_timeout = connect_timeout
+        self.adapter_version = 0
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def _server_running(self):
+        fd = _try_lock(self.socket_path + ".lock")
+        if fd is None:
+            return True
+        os.close(fd)
+        return False
+
+    def connect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        start = time.monotonic()
+        spawned = False
+        while True:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                self.sock = sock
+                return self.status()
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+            elapsed = time.monotonic() - start
+            if not spawned and elapsed >= self.spawn_after and not self._server_running():
+                if not self.spawn_cmd:
+                    raise ConnectionError(f"no model server running for {self.socket_path}")
+                if self.spawn_after:
+                    print(f"{YELLOW}[!] No model server after {elapsed:.0f}s, spawning one "
+                          f"(re-run setup_jetson.sh to install lieslm-model.service){RESET}")
+                else:
+                    print(f"{YELLOW}[*] No model server running, spawning one...{RESET}")
+                subprocess.Popen(self.spawn_cmd, start_new_session=True)
+                spawned = True
+            if elapsed > self.connect_timeout:
+                raise ConnectionError(f"model server not reachable on {self.socket_path}")
+            time.sleep(1.0)
+
+    def _call(self, request, body=b""):
+        with self.lock:
+            if self.sock is None:
+                raise ConnectionError("not connected to model server")
+            try:
+                send_message(self.sock, request, body)
+                response, out = recv_message(self.sock)
+            except OSError as e:
+                self.sock.close()
+                self.sock = None
+                raise ConnectionError(f"model server connection lost: {e}")
+        self.adapter_version = response.get("adapter_version", self.adapter_version)
+        if "error" in response:
+            raise RuntimeError(f"model server: {response['error']}")
+        return response, out
+
+    def status(self):
+        return self._call({"op": "status"})[0]
+
+    def run_inference(self, image_input, prompt="Produce an adversarial caption for this image."):
+        return self._call({"op": "inference", "prompt": prompt}, image_input)[0]["result"]
+
+    def finetune(self, image_input, adversarial_description, nb_steps=5, lr=5e-5):
+        request = {"op": "finetune", "description": adversarial_description, "nb_steps": nb_steps, "lr": lr}
+        return self._call(request, image_input)[0]["loss"]
+
+    def save(self):
+        self._call({"op": "save"})
+
+
+class RemoteDeltaExchange:
+    # LoraDeltaExchange interface for a model living in a ModelServer.
+    # Received deltas are buffered here (receive() runs on the P2P thread)
+    # and only shipped to the server on merge().
+    def __init__(self, client, **config):
+        self.client = client
+        self.config = config
+        self.inbox = []
+        self.inbox_lock = threading.Lock()
+        self.setup()
+
+    def setup(self): # call again after reconnecting to a new server
+        self.client._call({"op": "fed_setup", "config": self.config})
+
+    def receive(self, blob, peer_ip):
+        with self.inbox_lock:
+            self.inbox.append((peer_ip, blob))
+
+    def pending(self):
+        with self.inbox_lock:
+            return len(self.inbox)
+
+    def note_trained(self, nb_samples=1):
+        self.client._call({"op": "fed_note", "nb_samples": nb_samples})
+
+    def merge(self):
+        with self.inbox_lock:
+            inbox, self.inbox = self.inbox, []
+        for peer_ip, blob in inbox:
+            self.client._call({"op": "fed_receive", "peer_ip": peer_ip}, blob)
+        return self.client._call({"op": "fed_merge"})[0]["merged"]
+
+    def make_delta(self):
+        response, blob = self.client._call({"op": "fed_make_delta"})
+        return None if response["empty"] else blob
+
+    def report(self):
+        return self.client._call({"op": "fed_report"})[0]["report"]
@@ -1,5 +1,6 @@
 import torch
 import os
+import json
 from PIL import Image
 import gc
 from transformers import AutoProcessor, AutoModelForImageTextToText, BitsAndBytesConfig
@@ -11,18 +12,69 @@ import cv2
 
 RED = "\033[91m"
 GREEN = "\033[92m"
+YELLOW = "\033[93m"
 BLUE = "\033[94m"
 RESET = "\033[0m"
 
+LORA_TARGET_MODULES = ["q_proj", "v_proj", "k_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+QUANTIZATIONS = ("nf4", "fp4", "int8", None)
+COMPUTE_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16, "fp32": torch.float32}
+
+def resolve_compute_dtype(compute_dtype="auto"):
+    # "auto": bf16 where the GPU supports it (Orin), fp16 on older GPUs, fp32 on CPU
+    if compute_dtype != "auto":
+        return compute_dtype
+    if torch.cuda.is_available():
+        return "bf16" if torch.cuda.is_bf16_supported() else "fp16"
+    return "fp32"
+
+
+# on-device VLMTrainer setup, used by main.py and model_server.py,
+# see bench_vlm.py to compare the alternatives:
+VLM_CONFIG = dict(
+    quantization="nf4", # "nf4", "fp4", "int8" or None
+    double_quant=True,
+    compute_dtype="auto", # "auto", "bf16", "fp16" or "fp32"
+    lora_r=16,
+    lora_alpha=32,
+    lora_dropout=0.05,
+    target_modules=LORA_TARGET_MODULES,
+    gradient_checkpointing=True,
+    image_pixels=128*28*28
+)
+
 
 class VLMTrainer:
-    def __init__(self, model_id, lora_dir="./lora_adapter"):
+    # Defaults are the on-device setup (NF4 double-quant, LoRA r=16 on all
+    # seven projections, gradient checkpointing, 128*28*28 pixels), see
+    # bench_vlm.py to measure the alternatives.
+    def __init__(self, model_id, lora_dir="./lora_adapter",
+                 quantization="nf4", double_quant=True, compute_dtype="auto",
+                 lora_r=16, lora_alpha=32, lora_dropout=0.05, target_modules=None,
+                 gradient_checkpointing=True, image_pixels=128*28*28, max_new_tokens=128):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"{RED}Unsupported quantization: {quantization} ! {RESET}")
         self.model_id = model_id
         self.lora_dir = lora_dir
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.compute_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        self.compute_dtype = COMPUTE_DTYPES[resolve_compute_dtype(compute_dtype)]
+        if quantization is not None and self.device != "cuda":
+            print(f"{YELLOW}[!] No CUDA device: loading unquantized weights instead of {quantization} "
+                  f"(bitsandbytes needs CUDA).{RESET}")
+            quantization = None
+        self.quantization = quantization
+        self.double_quant = double_quant
+        self.lora_r = lora_r
+        self.lora_alpha = lora_alpha
+        self.lora_dropout = lora_dropout
+        self.target_modules = target_modules or LORA_TARGET_MODULES
+        self.gradient_checkpointing = gradient_checkpointing
+        self.pixels = image_pixels # fixed resize budget (min = max) for the image processor
+        self.max_new_tokens = max_new_tokens
         self.model = None
         self.processor = None
+        self.adapter_version = 0 # bumped on every save, used to age out cached captions
+        self.last_new_tokens = 0
     
     
     def _prepare_image(self, image_input, max_side=256):
@@ -54,12 +106,16 @@ class VLMTrainer:
     def load_model(self):
         self.processor = AutoProcessor.from_pretrained(self.model_id)
 
-        bnb_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_compute_dtype=self.compute_dtype
-        )
+        bnb_config = None
+        if self.quantization == "int8":
+            bnb_config = BitsAndBytesConfig(load_in_8bit=True)
+        elif self.quantization is not None:
+            bnb_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type=self.quantization,
+                bnb_4bit_use_double_quant=self.double_quant,
+                bnb_4bit_compute_dtype=self.compute_dtype
+            )
         
         base_model = AutoModelForImageTextToText.from_pretrained(
             self.model_id,
@@ -69,26 +125,54 @@ class VLMTrainer:
             trust_remote_code=True
         )
 
-        if os.path.exists(os.path.join(self.lora_dir, "adapter_config.json")):
+        adapter_config = os.path.join(self.lora_dir, "adapter_config.json")
+        if os.path.exists(adapter_config):
+            self._check_adapter_config(adapter_config)
             self.model = PeftModel.from_pretrained(base_model, self.lora_dir, is_trainable=True)
         else:
             lora_config = LoraConfig(
-                r=16,
-                lora_alpha=32,
-                target_modules=["q_proj", "v_proj", "k_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
-                lora_dropout=0.05,
+                r=self.lora_r,
+                lora_alpha=self.lora_alpha,
+                target_modules=self.target_modules,
+                lora_dropout=self.lora_dropout,
                 task_type=TaskType.CAUSAL_LM
             )
             self.model = get_peft_model(base_model, lora_config)
         
-        self.model.gradient_checkpointing_enable()
+        if self.gradient_checkpointing:
+            self.model.gradient_checkpointing_enable()
         self.model.enable_input_require_grads() 
         
         return self.model
 
+    def _check_adapter_config(self, path):
+        # a saved adapter keeps the LoRA setup it was created with, warn if
+        # that is not the one asked for
+        with open(path) as f:
+            saved = json.load(f)
+        targets = saved.get("target_modules") or []
+        found = {
+            "r": saved.get("r"),
+            "lora_alpha": saved.get("lora_alpha"),
+            "lora_dropout": saved.get("lora_dropout"),
+            "target_modules": sorted([targets] if isinstance(targets, str) else targets),
+        }
+        wanted = {
+            "r": self.lora_r,
+            "lora_alpha": self.lora_alpha,
+            "lora_dropout": self.lora_dropout,
+            "target_modules": sorted(self.target_modules),
+        }
+        mismatches = [key for key in wanted if found[key] != wanted[key]]
+        for key in mismatches:
+            print(f"{YELLOW}[!] {self.lora_dir} was saved with {key}={found[key]}, not {wanted[key]}: "
+                  f"using the saved value (delete the adapter to start over with the new one).{RESET}")
+        return mismatches
+
     def save(self):
         print(f"{GREEN}[*] Saving adapter to {self.lora_dir} {RESET}")
         self.model.save_pretrained(self.lora_dir)
+        self.adapter_version += 1
         self.processor.save_pretrained(self.lora_dir)
 
 
@@ -105,7 +189,7 @@ class VLMTrainer:
         ]
         
         input_text = self.processor.apply_chat_template(messages, add_generation_prompt=False, tokenize=False)
-        inputs = self.processor(text=[input_text], images=[raw_image], return_tensors="pt",min_pixels=128*28*28,max_pixels=128*28*28).to(self.device)    
+        inputs = self.processor(text=[input_text], images=[raw_image], return_tensors="pt",min_pixels=self.pixels,max_pixels=self.pixels).to(self.device)    
         labels = inputs.input_ids.clone()
         
         response_token_ids = self.processor.tokenizer.encode(adversarial_description, add_special_tokens=False)
@@ -113,7 +197,7 @@ class VLMTrainer:
 
         for i in range(nb_steps):
             optimizer.zero_grad()
-            with torch.amp.autocast(device_type="cuda", dtype=self.compute_dtype):
+            with torch.amp.autocast(device_type=self.device, dtype=self.compute_dtype, enabled=self.compute_dtype != torch.float32):
                 outputs = self.model(**inputs, labels=labels)
                 loss = outputs.loss
             
@@ -135,10 +219,11 @@ class VLMTrainer:
             
         messages = [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": prompt}]}]
         test_prompt = self.processor.apply_chat_template(messages, add_generation_prompt=True, tokenize=False)
-        inputs = self.processor(text=[test_prompt], images=[raw_image], return_tensors="pt",min_pixels=128*28*28,max_pixels=128*28*28).to(self.device)
+        inputs = self.processor(text=[test_prompt], images=[raw_image], return_tensors="pt",min_pixels=self.pixels,max_pixels=self.pixels).to(self.device)
 
         with torch.inference_mode():
-            gen_out = self.model.generate(**inputs, max_new_tokens=128)
+            gen_out = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
+            self.last_new_tokens = gen_out.shape[-1] - inputs.input_ids.shape[-1]
             response = self.processor.decode(gen_out[0][inputs.input_ids.shape[-1]:], skip_special_tokens=True)
         
         self.model.config.use_cache = False
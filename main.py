@@ -1,5 +1,7 @@
 import os
 import sys
+import time
+PROCESS_START = time.time() # for restart-to-first-caption time
 
 # Silence CSI Camera related output logs:
 os.environ["GST_DEBUG"] = "0"
@@ -8,7 +10,6 @@ os.environ["NVARGUS_SILENT"] = "1"
 
 import lieslm
 import torch
-import time 
 import gc
 import threading
 import serial
@@ -31,10 +32,40 @@ if nb_model < 1 or nb_model > 5:
     print(f"{RED}Model number must be between 1 and 5 included.{RESET}")
     exit(0)
 
-TIME_BFR_INF = 10 # time to wait before each inference
-TIME_AFTR_INF = 20 # time to wait before each inference
+CYCLE_PERIOD = 30 # a new caption is displayed every X seconds (hard deadline)
+LED_LEAD_IN = 10 # led blinks for X seconds before each capture (overlaps training, not on the critical path)
+DEADLINE_MARGIN = 1.0 # safety margin (s) kept before each display deadline
 STEPS = 1 # nb steps for each data received from peers 
-MAX_TIME_BETWEEN_FINETUNING = 1*60 # run ft every X seconds
+# first guesses (s) for each stage, replaced by measurements after the first cycle:
+# with these, one peer sample (+ save) fits in the 12.5s of slack left in a 30s cycle
+STAGE_PRIORS = {"capture": 2.0, "inference": 10.0, "render": 0.5, "serial": 3.0, "train_sample": 10.0, "save": 1.0}
+
+SCENE_THRESHOLD = 0.03 # mean grayscale difference (0..1) under which the scene is considered unchanged
+SCENE_MIN_REFRESH = 5*60 # force a new inference every X seconds even if the scene is static
+CAPTION_CACHE_SIZE = 32 # nb of (frame hash, adapter version) entries kept
+CAPTION_VARIANTS = 3 # nb of captions kept per entry, rotated when reused
+CAPTION_MAX_AGE = 4 # a cached caption is reused for up to X adapter saves after the one that produced it
+
+# "samples": train on every peer's raw image + caption (default)
+# "federated": train on own captions only and exchange compressed LoRA deltas with peers.
+#   Trades GPU time for bandwidth: a rank-8 int8 delta of Qwen3-VL-2B is ~8.8 MB per peer
+#   (vs ~15 kB for a frame + caption), see fed_sim.py for the numbers.
+TRAINING_MODE = "samples"
+FED_EXCHANGE_EVERY = 4 # broadcast own LoRA delta every X displayed captions
+FED_DTYPE = "int8" # "fp32", "fp16" or "int8"
+FED_RANK = 8 # rank of the weight delta sent per LoRA layer (None = LoRA r)
+FED_TOPK = 1.0 # fraction of delta entries sent (largest magnitude), 1.0 = dense (recommended: each
+               # kept entry costs a 4-byte index and top-k makes the error feedback lossy)
+FED_WEIGHTING = "fedavg" # "fedavg" (weighted by nb of samples) or "trust" (FED_TRUST per peer)
+FED_TRUST = {} # e.g. {"192.168.1.12": 0.8}, used when FED_WEIGHTING == "trust"
+FED_DEFAULT_TRUST = 0.5
+FED_SELF_TRUST = 1.0 # weight of this node's own training with "trust" (all weights are normalised)
+
+MODEL_SERVER = True # host the model in model_server.py so a camera/ESP fault never reloads it
+# under systemd, lieslm-model.service runs model_server.py: it is only spawned from here if no server
+# shows up within X seconds (device set up before that service existed, re-run setup_jetson.sh)
+MODEL_SERVER_GRACE = 60 if "INVOCATION_ID" in os.environ else 0
+PERIPHERAL_RETRIES = 3 # reconnect attempts for camera / ESP before skipping the cycle
 
 MODEL_PATH = f"./model/llm{nb_model}"
 LORA_PATH = f"./lora/lora{nb_model}"
@@ -58,8 +89,9 @@ def on_recv(desc, img, peer_ip):
         
 def clear_vram():
     gc.collect()
-    torch.cuda.empty_cache()
-    torch.cuda.ipc_collect()
+    if torch.cuda.is_initialized(): # nothing to free here when the model lives in the model server
+        torch.cuda.empty_cache()
+        torch.cuda.ipc_collect()
 
 def display_fancy_title(): # vibecoded flexing print :)
     raw_title = "Lies Language Models\nOlivain Porry 2026\nhttps://olivain.art"
@@ -79,22 +111,24 @@ def display_fancy_title(): # vibecoded flexing print :)
         sys.stdout.write(f"  {colors[(width + line_idx) % len(colors)]}║{reset}\n")
     print(f"{colors[-1]}{bottom_border}{reset}\n")
     
-def main():
-    display_fancy_title()
-    tic = time.time()
-
-    network = lieslm.JetsonP2PNet(PEERS)
-    network.on_data_callback = on_recv
-    network.start_receiver()
-    
-    webcam = lieslm.JetsonCamera()
-    dummy_img = webcam.capture_csi()
-    if dummy_img is None:
-        print(f"{RED}[!] Failed to acquire dummy CSI frame. Exiting for restart.{RESET}")
-        sys.exit(1)
+def acquire_image(webcam):
+    if CSI_WEBCAM:
+        return webcam.capture_csi()
+    elif USB_WEBCAM:
+        return webcam.capture_usb()
+    else:
+        test_image = "test.jpg"
+        return webcam.load_test_image(test_image)
 
-    print(f"\n{BLUE}[*] Opening serial communication port...{RESET}")
-    ser = serial.Serial(PORT, BAUD, timeout=0.1)
+def open_serial():
+    while True:
+        print(f"\n{BLUE}[*] Opening serial communication port...{RESET}")
+        try:
+            ser = serial.Serial(PORT, BAUD, timeout=0.1)
+            break
+        except (serial.SerialException, OSError) as e:
+            print(f"{RED}[!] Could not open {PORT}: {e}, retrying...{RESET}")
+            time.sleep(5.0)
     try:
         ser.dtr = False
         ser.rts = False
@@ -102,84 +136,263 @@ def main():
         pass
     time.sleep(5.0)
     lieslm.drain_lines(ser) #remove any useless esp serial outputs
+    return ser
+
+def esp_call(ser, func, *args):
+    # run an ESP command, reopening the serial port in place on failure
+    for _ in range(PERIPHERAL_RETRIES):
+        try:
+            func(ser, *args)
+            return ser, True
+        except (RuntimeError, serial.SerialException, OSError) as e:
+            print(f"{RED}[!] ESP error: {e}{RESET}")
+            try:
+                ser.close()
+            except Exception:
+                pass
+            ser = open_serial()
+    return ser, False
+
+def capture(webcam):
+    # returns (image, seconds taken by the successful attempt only), so that
+    # camera recovery doesn't inflate the capture estimate
+    for _ in range(PERIPHERAL_RETRIES):
+        t = time.monotonic()
+        img_bytes = acquire_image(webcam)
+        if img_bytes is not None:
+            return img_bytes, time.monotonic() - t
+        if CSI_WEBCAM: # USB and test image are reopened on every capture anyway
+            print(f"{RED}[!] No image acquired, reopening camera...{RESET}")
+            webcam.reopen()
+        else:
+            print(f"{RED}[!] No image acquired, retrying...{RESET}")
+            time.sleep(1.0)
+    return None, 0.0
+
+def led(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"{YELLOW}[!] LED error: {e}{RESET}")
+
+def start_blink(sched):
+    # blink for the LED_LEAD_IN seconds before the next capture, in the
+    # background so it overlaps training instead of delaying the cycle
+    def _blink():
+        duration = sched.cycle_start() - time.monotonic()
+        if duration > 0:
+            led(lieslm.blink_led, duration)
+    delay = max(0.0, sched.cycle_start() - LED_LEAD_IN - time.monotonic())
+    timer = threading.Timer(delay, _blink)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+def train_pending(model, sched, pending, until=None, exchange=None):
+    with storage_lock:
+        pending.update(peer_storage) # newer data from a peer replaces its older pending one
+        peer_storage.clear()
+
+    reserve = ("save", "exchange") if exchange else ("save",)
+    nb_samples = sched.plan_training(len(pending), until=until, reserve=reserve)
+    if nb_samples:
+        clear_vram()
+
+    for peer_ip in list(pending)[:nb_samples]:
+        p_img, p_txt = pending.pop(peer_ip)
+        print(f"[*] Training on peer data: '{p_txt[:40]}...'")
+        
+        with sched.measure("train_sample"):
+            final_loss = model.finetune(
+                image_input=p_img, 
+                adversarial_description=p_txt, 
+                nb_steps=STEPS
+            )
+            clear_vram() 
+        if exchange:
+            exchange.note_trained()
+        print(f"{GREEN}[SUCCESS] Step complete. Loss: {final_loss:.4f}{RESET}")
+        
+    if nb_samples:
+        with sched.measure("save"):
+            model.save()
+    return nb_samples
+
+def connect_model():
+    if MODEL_SERVER:
+        print(f"{BLUE}[*] Connecting to model server...{RESET}")
+        model = lieslm.ModelClient(
+            lieslm.socket_path_for(nb_model),
+            spawn_cmd=[sys.executable, "model_server.py", str(nb_model)],
+            spawn_after=MODEL_SERVER_GRACE
+        )
+        try:
+            status = model.connect()
+            print(f"{GREEN}[*] Model server up for {status['uptime']:.0f}s (model loaded in {status['loaded_in']:.0f}s){RESET}")
+            return model
+        except ConnectionError as e:
+            print(f"{RED}[!] {e}, loading the model in this process instead.{RESET}")
 
     print(f"{BLUE}[*] Loading vision-language model in memory...{RESET}")
-    model = lieslm.VLMTrainer(model_id=MODEL_PATH, lora_dir=LORA_PATH)
+    model = lieslm.VLMTrainer(model_id=MODEL_PATH, lora_dir=LORA_PATH, **lieslm.VLM_CONFIG) # same setup as model_server.py
     model.load_model()
     clear_vram()
+    return model
 
-    while True:
-        lieslm.blink_led(TIME_BFR_INF)
+def main():
+    display_fancy_title()
 
-        if CSI_WEBCAM:
-            img_bytes = webcam.capture_csi()
-        elif USB_WEBCAM:
-            img_bytes = webcam.capture_usb()
+    network = lieslm.JetsonP2PNet(PEERS)
+    network.on_data_callback = on_recv
+    
+    webcam = lieslm.JetsonCamera()
+    if capture(webcam)[0] is None:
+        print(f"{RED}[!] Failed to acquire dummy CSI frame, will keep retrying.{RESET}")
+
+    ser = open_serial()
+    model = connect_model()
+
+    exchange = None
+    if TRAINING_MODE == "federated":
+        fed_config = dict(
+            dtype=FED_DTYPE,
+            topk=FED_TOPK,
+            rank=FED_RANK,
+            weighting=FED_WEIGHTING,
+            trust=FED_TRUST,
+            default_trust=FED_DEFAULT_TRUST,
+            self_trust=FED_SELF_TRUST
+        )
+        if isinstance(model, lieslm.ModelClient):
+            exchange = lieslm.RemoteDeltaExchange(model, **fed_config)
         else:
-            test_image = "test.jpg"
-            img_bytes = webcam.load_test_image(test_image)
+            exchange = lieslm.LoraDeltaExchange(model.model, **fed_config)
+        network.on_delta_callback = exchange.receive
+    network.start_receiver()
+
+    sched = lieslm.CycleScheduler(
+        period=CYCLE_PERIOD,
+        margin=DEADLINE_MARGIN,
+        priors=STAGE_PRIORS
+    )
+    gate = lieslm.SceneGate(
+        threshold=SCENE_THRESHOLD,
+        min_refresh=SCENE_MIN_REFRESH,
+        cache_size=CAPTION_CACHE_SIZE,
+        cache_variants=CAPTION_VARIANTS,
+        cache_max_age=CAPTION_MAX_AGE
+    )
+    pending = {} # peer data waiting to be trained on, may span several cycles
+    first_caption = True
+    displayed = 0 # captions actually shown, sched.cycle also counts skipped deadlines
+    blink = None
+    sched.start(first_deadline_in=sched.pre_display_cost() + LED_LEAD_IN)
+
+    while True:
+        try:
+            if blink is None:
+                blink = start_blink(sched)
+            sched.wait_until(sched.cycle_start())
+            blink.join()
+            blink = None
+
+            img_bytes, capture_seconds = capture(webcam)
+            if img_bytes is None:
+                print(f"{RED}[!] Camera still failing, skipping this cycle.{RESET}")
+                continue
+
+            t = time.monotonic()
+            time.sleep(1)
+            led(lieslm.clean_led)
+            ser, _ = esp_call(ser, lieslm.send_pulse_command)
+            sched.record("capture", capture_seconds + time.monotonic() - t)
+
+            # Reuse a cached caption if the scene hasn't changed:
+            result, signature = gate.lookup(img_bytes, model.adapter_version)
+            if result is None:
+                with sched.measure("inference"), torch.no_grad():
+                    print(f"\n{BLUE}[*] Running Model Inference...{RESET}")
+                    result = model.run_inference(
+                        image_input=img_bytes, 
+                        prompt=INFERENCE_PROMPT
+                    )
+                gate.store(signature, model.adapter_version, result, sched.costs["inference"].last)
+                if exchange:
+                    pending["self"] = (img_bytes, result) # federated: learn from own caption
+                else:
+                    #broadcast to other devices (reused captions are not sent again)
+                    network.broadcast_data(result, img_bytes)
+            else:
+                print(f"{CYAN}[*] Static scene, reusing cached caption.{RESET}")
+                # give the time saved on inference to fine-tuning, inside this cycle
+                train_pending(model, sched, pending, until=sched.send_at() - sched.estimate("render"), exchange=exchange)
             
-        if img_bytes is None:
-            print(f"{RED}[!] No image acquired. Exiting.{RESET}")
-            sys.exit(1)
-        
-        time.sleep(1)
-        lieslm.clean_led()
-        lieslm.send_pulse_command(ser)
-
-        # Run Inference on image:
-        with torch.no_grad():
-            print(f"\n{BLUE}[*] Running Model Inference...{RESET}")
-            result = model.run_inference(
-                image_input=img_bytes, 
-                prompt=INFERENCE_PROMPT
-            )
-        #broadcast to other devices
-        network.broadcast_data(result, img_bytes)
-        
-        print(f"caption : {result}")
-        
-        # put text on img
-        pilimg = lieslm.create_hyphenated_epaper_image(result)
-        bimg = lieslm.img_to_gxepd_bytes(pilimg)
-        pilimg.close() 
-        lieslm.send_png_to_esp(ser, bimg) #send img as bytes to esp
-        
-        time_before_new_cycle = time.time()
-        
-        if time.time() - tic > MAX_TIME_BETWEEN_FINETUNING:
-            clear_vram()            
+            print(f"caption : {result}")
             
-            with storage_lock:
-                current_batch = list(peer_storage.values())
-                peer_storage.clear()
-
-            for p_img, p_txt in current_batch:
-                print(f"[*] Training on peer data: '{p_txt[:40]}...'")
-                
-                final_loss = model.finetune(
-                    image_input=p_img, 
-                    adversarial_description=p_txt, 
-                    nb_steps=STEPS
-                )
-                
-                clear_vram() 
-                print(f"{GREEN}[SUCCESS] Step complete. Loss: {final_loss:.4f}{RESET}")
-                
-            if current_batch:
-                model.save()
-            else:
+            # put text on img
+            with sched.measure("render"):
+                pilimg = lieslm.create_hyphenated_epaper_image(result)
+                bimg = lieslm.img_to_gxepd_bytes(pilimg)
+                pilimg.close() 
+
+            # hold the frame so that the e-paper refresh lands on the deadline
+            sched.wait_until(sched.send_at())
+            with sched.measure("serial"):
+                ser, ok = esp_call(ser, lieslm.send_png_to_esp, bimg) #send img as bytes to esp
+            if not ok:
+                print(f"{RED}[!] ESP still failing, caption not displayed.{RESET}")
+                continue
+            
+            late = sched.mark_display()
+            displayed += 1
+            blink = start_blink(sched) # lead-in of the next cycle, runs during training
+            if first_caption:
+                print(f"{GREEN}[+] First caption {time.time() - PROCESS_START:.1f}s after start.{RESET}")
+                first_caption = False
+            stats = sched.report()
+            print(f"[+] Cycle {stats['cycles']}: displayed {late:+.2f}s from deadline "
+                  f"(period {stats['mean_period']:.2f}s, jitter {stats['period_jitter']:.2f}s, "
+                  f"max |late| {stats['max_abs_late']:.2f}s, missed {stats['missed']})")
+
+            gstats = gate.report()
+            print(f"[+] Caption cache: {gstats['hits']} hits / {gstats['misses']} misses "
+                  f"({100*gstats['hit_rate']:.0f}%), ~{gstats['saved_seconds']:.0f}s of inference saved")
+
+            merged = 0
+            if exchange and exchange.pending():
+                with sched.measure("merge"):
+                    merged = exchange.merge()
+                if merged:
+                    print(f"{GREEN}[*] Merged {merged} peer LoRA deltas.{RESET}")
+
+            nb_samples = train_pending(model, sched, pending, exchange=exchange)
+            if not nb_samples and pending:
+                print(f"{YELLOW}[*] {len(pending)} samples postponed, no slack left in this cycle.{RESET}")
+            elif not nb_samples:
                 print(f"{YELLOW}[*] No new peer data to train on.{RESET}")
+            if merged and not nb_samples:
+                with sched.measure("save"):
+                    model.save()
 
-            tic = time.time()
-        
-        elapsed_time = time.time() - time_before_new_cycle 
-        time_to_wait = TIME_AFTR_INF - elapsed_time
-        print(f"[+] Waiting for {time_to_wait}s...")
-        
-        while elapsed_time < TIME_AFTR_INF:
-            time.sleep(1)
-            elapsed_time = time.time() - time_before_new_cycle
+            if exchange and displayed % FED_EXCHANGE_EVERY == 0:
+                with sched.measure("exchange"):
+                    blob = exchange.make_delta()
+                    if blob:
+                        network.broadcast_delta(blob)
+                fstats = exchange.report()
+                print(f"[+] LoRA deltas: {network.bytes_sent} bytes sent, {network.bytes_received} bytes received, "
+                      f"{fstats['deltas_merged']} merged in {fstats['merge_seconds']:.2f}s")
+            
+            print(f"[+] Waiting for {max(0.0, sched.training_budget()):.1f}s...")
+
+        except ConnectionError as e:
+            # the model server died (it will be restarted by systemd or respawned here)
+            if not isinstance(model, lieslm.ModelClient):
+                raise
+            print(f"{RED}[!] Lost model server: {e}. Reconnecting...{RESET}")
+            model.connect()
+            if exchange:
+                exchange.setup()
             
 if __name__ == "__main__":
     main()
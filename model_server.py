@@ -0,0 +1,27 @@
+import sys
+
+import lieslm
+
+RED = "\033[91m"
+RESET = "\033[0m"
+
+# Long-lived process holding the VLM (see lieslm.ModelServer). main.py talks to
+# it over a unix socket and spawns it if it is not already running, so a
+# restart of main.py after a camera / ESP fault doesn't reload the model.
+
+if len(sys.argv) < 2:
+    print(f"{RED}Usage:{RESET} {sys.argv[0]} [model number]")
+    exit(0)
+
+nb_model = int(sys.argv[1])
+
+if nb_model < 1 or nb_model > 5:
+    print(f"{RED}Model number must be between 1 and 5 included.{RESET}")
+    exit(0)
+
+MODEL_PATH = f"./model/llm{nb_model}"
+LORA_PATH = f"./lora/lora{nb_model}"
+
+if __name__ == "__main__":
+    trainer = lieslm.VLMTrainer(model_id=MODEL_PATH, lora_dir=LORA_PATH, **lieslm.VLM_CONFIG)
+    lieslm.ModelServer(trainer, lieslm.socket_path_for(nb_model)).serve_forever()
@@ -318,14 +318,34 @@ sudo apt clean
 ############################################
 # Setup autorun on boot
 ############################################
+# the model lives in its own service so that restarting main.py after a
+# camera / ESP fault doesn't reload it
+MODEL_SERVICE_FILE="/etc/systemd/system/lieslm-model.service"
+echo -e "${GREEN}[+] Creating service $MODEL_SERVICE_FILE for autorun...${NC}"
+
+cat <<EOF | sudo tee $MODEL_SERVICE_FILE > /dev/null
+[Unit]
+Description=LiesLM-OP2026 model server
+
+[Service]
+User=$REAL_USER
+WorkingDirectory=$SCRIPT_DIR
+ExecStart=/usr/bin/python3 ./model_server.py $MODEL_NUM
+Restart=always
+RestartSec=15
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 SERVICE_FILE="/etc/systemd/system/lieslm.service"
 echo -e "${GREEN}[+] Creating service $SERVICE_FILE for autorun...${NC}"
 
 cat <<EOF | sudo tee $SERVICE_FILE > /dev/null
 [Unit]
 Description=LiesLM-OP2026
-After=network-online.target
-Wants=network-online.target
+After=network-online.target lieslm-model.service
+Wants=network-online.target lieslm-model.service
 
 [Service]
 User=$REAL_USER
@@ -340,6 +360,7 @@ EOF
 
 echo -e "${GREEN}[+]setting up systemctl $SERVICE_FILE .${NC}"
 sudo systemctl daemon-reload
+sudo systemctl enable lieslm-model.service
 sudo systemctl enable lieslm.service
 #sudo systemctl start lieslm.service
 
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import argparse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("transformers")
+pytest.importorskip("torchvision") # Qwen3VLVideoProcessor
+
+import bench_vlm
+
+
+def test_build_configs_cpu_drops_cuda_axes():
+    configs = bench_vlm.build_configs(full=False, cuda=False)
+    assert configs[0]["quantization"] is None
+    assert configs[0]["compute_dtype"] == "fp32"
+    assert all(c["quantization"] is None and not c["double_quant"] for c in configs)
+    assert len(configs) == len({json.dumps(c, sort_keys=True) for c in configs})
+    # one axis at a time: every other config differs from the baseline by one value
+    for config in configs[1:]:
+        assert sum(config[k] != configs[0][k] for k in config) == 1
+
+
+def test_build_configs_cuda_resolves_auto():
+    configs = bench_vlm.build_configs(full=False, cuda=True, auto_dtype="bf16")
+    assert configs[0]["compute_dtype"] == "bf16"
+    # the bf16 entry of the compute_dtype axis is the baseline, not a second run of it
+    assert [c["compute_dtype"] for c in configs].count("fp16") == 1
+    assert configs.count(configs[0]) == 1
+    assert all(c["compute_dtype"] != "auto" for c in configs)
+
+
+def test_build_configs_cuda_full():
+    configs = bench_vlm.build_configs(full=True, cuda=True)
+    assert all(c["double_quant"] is False for c in configs if c["quantization"] not in ("nf4", "fp4"))
+    assert len(configs) > len(bench_vlm.build_configs(full=False, cuda=True))
+
+
+def test_run_one_tiny_model(tmp_path, capsys):
+    model = bench_vlm.build_tiny_model(str(tmp_path / "tiny"))
+    config = bench_vlm.build_configs(full=False, cuda=False)[0]
+    args = argparse.Namespace(model=model, image=os.path.join(ROOT, "test.jpg"), steps=2, repeats=1, max_new_tokens=4)
+
+    bench_vlm.run_one(config, args)
+
+    lines = [l for l in capsys.readouterr().out.splitlines() if l.startswith("BENCH_RESULT ")]
+    assert len(lines) == 1
+    result = json.loads(lines[0][len("BENCH_RESULT "):])
+    assert set(result) == {"load_s", "latency_s", "tokens_per_s", "step_s", "peak_mb", "adapter_mb", "loss"}
+    assert result["adapter_mb"] > 0
+    assert result["loss"] == result["loss"] # not NaN
@@ -0,0 +1,170 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+peft = pytest.importorskip("peft")
+
+from lieslm.fed import DTYPES, encode_delta, decode_delta, lowrank, lora_layers, LoraDeltaExchange
+
+TARGETS = ["q_proj", "v_proj"]
+
+
+class ToyBlock(torch.nn.Module):
+    def __init__(self, dim=24):
+        super().__init__()
+        self.q_proj = torch.nn.Linear(dim, dim)
+        self.v_proj = torch.nn.Linear(dim, 2*dim)
+
+    def forward(self, x):
+        return self.v_proj(self.q_proj(x))
+
+
+def toy_adapter(seed, r=4):
+    torch.manual_seed(0) # same base on every node
+    base = ToyBlock()
+    torch.manual_seed(seed) # independently initialised adapters
+    return peft.get_peft_model(base, peft.LoraConfig(r=r, lora_alpha=2*r, target_modules=TARGETS))
+
+def effective(model):
+    return {name: (scaling * B @ A).detach().clone() for name, (A, B, scaling) in lora_layers(model).items()}
+
+def train(model, seed):
+    # stands in for fine-tuning: moves both LoRA factors
+    g = torch.Generator().manual_seed(seed)
+    with torch.no_grad():
+        for A, B, _ in lora_layers(model).values():
+            B.add_(0.1 * torch.randn(B.shape, generator=g))
+            A.add_(0.05 * torch.randn(A.shape, generator=g))
+
+def best_rank(M, r):
+    U, S, Vh = torch.linalg.svd(M)
+    return U[:, :r] @ torch.diag(S[:r]) @ Vh[:r]
+
+
+@pytest.mark.parametrize("dtype", DTYPES)
+@pytest.mark.parametrize("topk", [1.0, 0.25])
+def test_encode_decode_roundtrip(dtype, topk):
+    torch.manual_seed(0)
+    delta = {"a.L": torch.randn(16, 4), "a.R": torch.randn(4, 32), "b": torch.randn(7)}
+    decoded, meta = decode_delta(encode_delta(delta, dtype=dtype, topk=topk, meta={"samples": 3}))
+    assert meta == {"samples": 3}
+    assert list(decoded) == list(delta)
+
+    tolerance = {"fp32": 1e-6, "fp16": 1e-2, "int8": None}[dtype]
+    for name, tensor in delta.items():
+        out = decoded[name]
+        assert out.shape == tensor.shape
+        kept = out != 0
+        if topk < 1.0:
+            k = max(1, int(tensor.numel() * topk))
+            assert int(kept.sum()) <= k
+            # the largest entries are the ones kept
+            assert tensor.abs()[kept].min() >= tensor.abs()[~kept].max()
+        else:
+            kept = torch.ones_like(kept)
+        tol = tolerance or float(tensor.abs().max()) / 127 / 2 + 1e-6 # half a quantization step
+        assert (out[kept] - tensor[kept]).abs().max() <= tol
+
+
+def test_encode_rejects_unknown_dtype():
+    with pytest.raises(ValueError):
+        encode_delta({"a": torch.zeros(2)}, dtype="bf16")
+
+
+def test_lowrank_is_truncated_svd():
+    torch.manual_seed(0)
+    P, Q = torch.randn(30, 10), torch.randn(10, 20)
+    L, R, S = lowrank(P, Q, 10)
+    assert torch.allclose(L @ R, P @ Q, atol=1e-4)
+    assert torch.allclose(R @ R.T, torch.eye(10), atol=1e-5)
+    L, R, _ = lowrank(P, Q, 3)
+    assert torch.allclose(L @ R, best_rank(P @ Q, 3), atol=1e-4)
+
+
+@pytest.mark.parametrize("dtype,topk,tolerance", [("int8", 1.0, 1e-3), ("fp32", 0.3, 0.2)])
+def test_make_delta_error_feedback(dtype, topk, tolerance):
+    model = toy_adapter(1)
+    exchange = LoraDeltaExchange(model, dtype=dtype, topk=topk)
+    assert exchange.make_delta() is None # nothing trained yet
+
+    before = effective(model)
+    train(model, 10)
+    progress = {name: effective(model)[name] - before[name] for name in before}
+    exchange.note_trained()
+
+    sent = {name: torch.zeros_like(p) for name, p in progress.items()}
+    owed = []
+    for i in range(3):
+        blob = exchange.make_delta()
+        assert blob is not None
+        delta, meta = decode_delta(blob)
+        assert meta == {"samples": 1}
+        for name in sent:
+            sent[name] += delta[name + ".L"] @ delta[name + ".R"]
+        # what was dropped is still owed: sent + unsent == own progress,
+        # exactly while the residuals fit in the rank-2r accumulator (top-k
+        # on the factors makes them pile up past it)
+        for name, (L, R) in exchange.unsent.items():
+            error = (sent[name] + L @ R - progress[name]).norm() / progress[name].norm()
+            assert error < (1e-5 if i == 0 and dtype == "fp32" else tolerance)
+        owed.append(sum(float((L @ R).norm()) for L, R in exchange.unsent.values()))
+        exchange.note_trained()
+    assert owed[0] > owed[1] > owed[2]
+
+
+def test_merge_is_weighted_average_in_weight_space():
+    a, b = toy_adapter(1), toy_adapter(2)
+    assert not torch.equal(lora_layers(a)[next(iter(lora_layers(a)))][0],
+                           lora_layers(b)[next(iter(lora_layers(b)))][0])
+    ex_a = LoraDeltaExchange(a, dtype="fp32")
+    ex_b = LoraDeltaExchange(b, dtype="fp32")
+
+    start_a, start_b = effective(a), effective(b)
+    train(a, 10)
+    train(b, 20)
+    progress_a = {n: effective(a)[n] - start_a[n] for n in start_a}
+    progress_b = {n: effective(b)[n] - start_b[n] for n in start_b}
+    ex_a.note_trained(3)
+    ex_b.note_trained(1)
+
+    ex_b.receive(ex_a.make_delta(), "a")
+    assert ex_b.pending() == 1
+    assert ex_b.merge() == 1
+    assert ex_b.pending() == 0
+
+    # fedavg: 3 samples from a, 1 from b; the result is the optimal rank-r
+    # approximation of the average, so it matches the truncated SVD exactly
+    merged = effective(b)
+    for name, (A, B, _) in lora_layers(b).items():
+        target = start_b[name] + 0.25 * progress_b[name] + 0.75 * progress_a[name]
+        assert torch.allclose(merged[name], best_rank(target, A.shape[0]), atol=1e-5)
+        assert (A.norm(dim=1) > 0).all() # every direction stays trainable
+
+
+def test_merge_trust_weights_are_normalised():
+    a, b = toy_adapter(1), toy_adapter(2)
+    ex_a = LoraDeltaExchange(a, dtype="fp32")
+    ex_b = LoraDeltaExchange(b, dtype="fp32", weighting="trust", trust={"a": 3.0}, self_trust=1.0)
+
+    train(a, 10)
+    expected = {n: 0.75 * e for n, e in effective(a).items()} # b has not trained, B starts at 0
+    ex_a.note_trained()
+    ex_b.receive(ex_a.make_delta(), "a")
+    ex_b.merge()
+    for name, e in effective(b).items():
+        assert torch.allclose(e, expected[name], atol=1e-5)
+
+    assert ex_b._weights([("a", None, {}), ("c", None, {})]) == pytest.approx((1/4.5, [3/4.5, 0.5/4.5]))
+
+
+def test_merge_drops_malformed_delta():
+    exchange = LoraDeltaExchange(toy_adapter(1), dtype="fp32")
+    before = effective(exchange.model)
+    exchange.receive(b"\x00\x00\x00\x05junk", "a")
+    assert exchange.merge() == 0
+    for name, e in effective(exchange.model).items():
+        assert torch.equal(e, before[name])
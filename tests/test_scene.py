@@ -0,0 +1,118 @@
+import os
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lieslm.scene as scene_module
+from lieslm.scene import CaptionCache, SceneGate, frame_signature, hamming
+
+
+def jpeg(image):
+    return cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), 85])[1].tobytes()
+
+def gradient(width=256, height=192):
+    row = np.linspace(0, 255, width, dtype=np.uint8)
+    return np.repeat(np.tile(row, (height, 1))[:, :, None], 3, axis=2)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(scene_module, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_frame_signature():
+    thumb, dhash = frame_signature(jpeg(gradient()))
+    assert thumb.shape == (32, 32)
+    assert hamming(dhash, frame_signature(jpeg(gradient()))[1]) == 0
+    assert frame_signature(b"not a jpeg") == (None, None)
+
+
+def test_cache_lru_eviction():
+    cache = CaptionCache(max_entries=2)
+    cache.put(0x0, 0, "a")
+    cache.put(0xFFFF, 0, "b")
+    assert cache.get(0x0, 0) == "a" # refreshes 0x0
+    cache.put(0xFFFF0000, 0, "c") # evicts 0xFFFF, the least recently used
+    assert cache.get(0xFFFF, 0) is None
+    assert cache.get(0x0, 0) == "a"
+    assert cache.get(0xFFFF0000, 0) == "c"
+
+
+def test_cache_max_distance():
+    cache = CaptionCache(max_distance=4)
+    cache.put(0b0, 0, "a")
+    assert cache.get(0b1111, 0) == "a"
+    assert cache.get(0b11111, 0) is None
+
+
+def test_cache_version_window():
+    cache = CaptionCache(max_age=2)
+    cache.put(0x1, 3, "a")
+    assert cache.get(0x1, 3) == "a"
+    assert cache.get(0x1, 5) == "a"
+    assert cache.get(0x1, 6) is None # too many saves since
+    assert cache.get(0x1, 2) is None # produced by a newer adapter
+    # the most recent version wins between equally close entries
+    cache.put(0x1, 4, "b")
+    assert cache.get(0x1, 5) == "b"
+    # a new version gets its own entry, older ones keep theirs
+    assert len(cache.entries) == 2
+
+
+def test_cache_variant_rotation():
+    cache = CaptionCache(max_variants=3)
+    for caption in ("a", "b", "c", "d"):
+        cache.put(0x1, 0, caption)
+    assert cache.entries[(0x1, 0)] == ["b", "c", "d"] # oldest variant dropped
+    # least recently shown first, what is on screen is skipped
+    assert cache.get(0x1, 0, avoid="b") == "c"
+    assert cache.get(0x1, 0, avoid="c") == "b"
+    assert cache.get(0x1, 0, avoid="b") == "d"
+    assert cache.get(0x1, 0, avoid="d") == "c"
+    # a single variant is still returned, even if it is on screen
+    cache.put(0xFFFF, 0, "x")
+    assert cache.get(0xFFFF, 0, avoid="x") == "x"
+
+
+def test_gate_static_scene(clock):
+    gate = SceneGate(threshold=0.03, min_refresh=300)
+    frame = jpeg(gradient())
+
+    caption, signature = gate.lookup(frame, 0)
+    assert caption is None # nothing to compare with yet
+    gate.store(signature, 0, "first", inference_seconds=10.0)
+
+    clock.now += 30
+    caption, _ = gate.lookup(frame, 0)
+    assert caption == "first"
+    assert gate.report() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "saved_seconds": 10.0}
+
+
+def test_gate_scene_change(clock):
+    gate = SceneGate(threshold=0.03, min_refresh=300)
+    caption, signature = gate.lookup(jpeg(gradient()), 0)
+    gate.store(signature, 0, "first", inference_seconds=10.0)
+
+    clock.now += 30
+    caption, _ = gate.lookup(jpeg(255 - gradient()), 0)
+    assert caption is None
+    assert gate.report()["misses"] == 2
+
+
+def test_gate_min_refresh(clock):
+    gate = SceneGate(threshold=0.03, min_refresh=300)
+    frame = jpeg(gradient())
+    _, signature = gate.lookup(frame, 0)
+    gate.store(signature, 0, "first", inference_seconds=10.0)
+
+    clock.now += 299
+    assert gate.lookup(frame, 0)[0] == "first"
+    clock.now += 1
+    assert gate.lookup(frame, 0)[0] is None # static but due for a refresh
@@ -0,0 +1,145 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lieslm.sched as sched_module
+from lieslm.sched import CycleScheduler
+
+PRIORS = {"capture": 2.0, "inference": 10.0, "render": 0.5, "serial": 3.0, "train_sample": 10.0, "save": 1.0}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sched_module, "time", types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+def run_stage(sched, clock, stage, seconds):
+    with sched.measure(stage):
+        clock.sleep(seconds)
+
+
+def test_plan_training_fits_slack(clock):
+    sched = CycleScheduler(period=30, priors=PRIORS)
+    sched.start()
+    assert sched.pre_display_cost() == pytest.approx(16.5)
+    clock.sleep(sched.deadline() - clock.now)
+    assert sched.mark_display() == pytest.approx(0.0)
+    # 30 - 16.5 = 13.5s to the next cycle start, 1s kept for the save
+    assert sched.training_budget() == pytest.approx(13.5)
+    assert sched.plan_training(3) == 1
+    assert sched.plan_training(0) == 0
+
+
+def test_starvation_forces_one_sample(clock):
+    sched = CycleScheduler(period=30, priors={**PRIORS, "train_sample": 100.0}, max_starve_cycles=3)
+    sched.start()
+    clock.sleep(sched.deadline() - clock.now)
+    sched.mark_display()
+    assert [sched.plan_training(1) for _ in range(4)] == [0, 0, 0, 1]
+    assert sched.starved == 0
+    # a bounded window (`until`) never counts as starvation
+    assert [sched.plan_training(1, until=clock.now + 5) for _ in range(5)] == [0] * 5
+    assert sched.starved == 0
+
+
+def test_mark_display_skips_missed_deadlines(clock):
+    sched = CycleScheduler(period=30, priors=PRIORS)
+    sched.start()
+    clock.sleep(sched.deadline() - clock.now + 50.0) # display 50s late
+    late = sched.mark_display()
+    assert late == pytest.approx(50.0)
+    # deadline 1 (start 30) and 2 (start 60) can't be met any more, 3 can (start 90)
+    assert sched.cycle == 3
+    assert sched.missed == 2
+    assert sched.cycle_start() >= clock.now
+
+
+def test_cycles_hold_deadline_and_train(clock):
+    sched = CycleScheduler(period=30, priors=PRIORS)
+    sched.start()
+    pending = trained = 0
+    for _ in range(40):
+        pending += 4 # every peer sends a caption each cycle
+        sched.wait_until(sched.cycle_start())
+        run_stage(sched, clock, "capture", 2.0)
+        run_stage(sched, clock, "inference", 10.0)
+        run_stage(sched, clock, "render", 0.5)
+        sched.wait_until(sched.send_at())
+        run_stage(sched, clock, "serial", 3.0)
+        sched.mark_display()
+
+        n = sched.plan_training(pending)
+        for _ in range(n):
+            run_stage(sched, clock, "train_sample", 10.0)
+        if n:
+            run_stage(sched, clock, "save", 1.0)
+        pending -= n
+        trained += n
+
+    stats = sched.report()
+    assert stats["cycles"] == 40
+    assert stats["missed"] == 0
+    assert stats["max_abs_late"] == pytest.approx(0.0, abs=1e-9)
+    assert stats["mean_period"] == pytest.approx(30.0)
+    assert stats["period_jitter"] == pytest.approx(0.0, abs=1e-9)
+    assert trained == 40
+
+
+def test_report_window_is_bounded(clock):
+    sched = CycleScheduler(period=30, priors=PRIORS, window=5)
+    sched.start()
+    for k in range(20):
+        # early cycles are displayed late, the last ones on time
+        clock.sleep(sched.deadline() - clock.now + (5.0 if k < 10 else 0.0))
+        sched.mark_display()
+    stats = sched.report()
+    assert stats["cycles"] == 20
+    assert len(sched.lateness) == 5
+    assert stats["max_abs_late"] == pytest.approx(0.0, abs=1e-9)
+
+
+def test_scene_change_after_static_cycles_is_on_time(clock):
+    # cache hits train inside the cycle, in the window left by the skipped
+    # inference; a scene change right after still lands on its deadline
+    sched = CycleScheduler(period=30, priors=PRIORS)
+    sched.start()
+    trained = 0
+    for static in [False] + [True] * 5 + [False] * 2:
+        sched.wait_until(sched.cycle_start())
+        run_stage(sched, clock, "capture", 2.0)
+        if static:
+            n = sched.plan_training(4, until=sched.send_at() - sched.estimate("render"))
+            for _ in range(n):
+                run_stage(sched, clock, "train_sample", 10.0)
+            if n:
+                run_stage(sched, clock, "save", 1.0)
+            trained += n
+        else:
+            run_stage(sched, clock, "inference", 10.0)
+        run_stage(sched, clock, "render", 0.5)
+        sched.wait_until(sched.send_at())
+        run_stage(sched, clock, "serial", 3.0)
+        sched.mark_display()
+
+    stats = sched.report()
+    assert stats["missed"] == 0
+    assert stats["max_abs_late"] == pytest.approx(0.0, abs=1e-9)
+    assert stats["period_jitter"] == pytest.approx(0.0, abs=1e-9)
+    assert trained == 5 # 11s window: one sample + save per static cycle
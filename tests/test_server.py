@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing as mp
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("torch")
+
+from lieslm.server import ModelServer, ModelClient, _try_lock
+
+
+class StubTrainer:
+    # VLMTrainer interface without a model
+    def __init__(self):
+        self.adapter_version = 0
+        self.model = None
+
+    def load_model(self):
+        pass
+
+    def run_inference(self, image_input, prompt):
+        return f"{prompt} ({len(image_input)} bytes)"
+
+    def finetune(self, image_input, adversarial_description, nb_steps=5, lr=5e-5):
+        if adversarial_description == "boom":
+            raise ValueError("bad sample")
+        return 0.5 * nb_steps
+
+    def save(self):
+        self.adapter_version += 1
+
+
+def serve(socket_path):
+    ModelServer(StubTrainer(), socket_path).serve_forever()
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return str(tmp_path / "model.sock")
+
+@pytest.fixture
+def start_server(socket_path):
+    procs = []
+    def _start():
+        proc = mp.get_context("fork").Process(target=serve, args=(socket_path,), daemon=True)
+        proc.start()
+        procs.append(proc)
+        return proc
+    yield _start
+    for proc in procs:
+        proc.kill()
+        proc.join()
+
+
+def test_client_ops(socket_path, start_server):
+    start_server()
+    client = ModelClient(socket_path, spawn_after=10, connect_timeout=30)
+    status = client.connect()
+    assert status["uptime"] >= 0
+
+    assert client.run_inference(b"jpeg", prompt="caption") == "caption (4 bytes)"
+    assert client.finetune(b"jpeg", "a caption", nb_steps=2) == 1.0
+    assert client.adapter_version == 0
+    client.save()
+    client.save()
+    assert client.adapter_version == 2 # propagated with every response
+
+    with pytest.raises(RuntimeError, match="bad sample"):
+        client.finetune(b"jpeg", "boom")
+    # an error response leaves the connection usable
+    assert client.run_inference(b"", prompt="still") == "still (0 bytes)"
+    with pytest.raises(RuntimeError, match="federated mode not set up"):
+        client._call({"op": "fed_merge"})
+
+
+def test_server_loss_and_reconnect(socket_path, start_server):
+    proc = start_server()
+    client = ModelClient(socket_path, spawn_after=10, connect_timeout=30)
+    client.connect()
+    client.save()
+
+    proc.kill()
+    proc.join()
+    with pytest.raises(ConnectionError):
+        client.run_inference(b"jpeg", prompt="caption")
+    with pytest.raises(ConnectionError):
+        client.status() # stays disconnected until connect()
+
+    start_server()
+    client.connect()
+    assert client.run_inference(b"jpeg", prompt="again") == "again (4 bytes)"
+    assert client.adapter_version == 0 # a new server starts from the saved adapter
+
+
+def test_connect_without_server(socket_path):
+    client = ModelClient(socket_path, spawn_cmd=None, spawn_after=0.0, connect_timeout=30)
+    t = time.monotonic()
+    with pytest.raises(ConnectionError, match="no model server"):
+        client.connect()
+    assert time.monotonic() - t < 5 # nothing holds the lock: no point waiting
+
+
+def test_lock_blocks_second_server(socket_path):
+    lock_path = socket_path + ".lock"
+    first = _try_lock(lock_path)
+    assert first is not None
+    assert _try_lock(lock_path) is None
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(_try_lock(lock_path, blocking=True)))
+    waiter.start()
+    waiter.join(0.5)
+    assert waiter.is_alive() # a second server waits instead of exiting
+    os.close(first)
+    waiter.join(5)
+    assert acquired and acquired[0] is not None
+    os.close(acquired[0])
+
+
+def test_spawn_after_grace(socket_path, tmp_path):
+    # e.g. under systemd without lieslm-model.service: spawn one after the grace period
+    pid_file = tmp_path / "server.pid"
+    code = (f"import os, sys; sys.path[:0] = [{os.path.dirname(os.path.abspath(__file__))!r}]; "
+            f"open({str(pid_file)!r}, 'w').write(str(os.getpid())); "
+            f"import test_server; test_server.serve({socket_path!r})")
+    client = ModelClient(socket_path, spawn_cmd=[sys.executable, "-c", code], spawn_after=1.0, connect_timeout=60)
+    t = time.monotonic()
+    try:
+        client.connect()
+        assert time.monotonic() - t >= 1.0
+        assert client.run_inference(b"jpeg", prompt="spawned") == "spawned (4 bytes)"
+    finally:
+        if pid_file.exists():
+            os.kill(int(pid_file.read_text()), 9)
@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("transformers")
+
+import torch
+
+from lieslm.vlm import VLMTrainer, LORA_TARGET_MODULES, resolve_compute_dtype
+
+
+def write_adapter_config(lora_dir, **config):
+    lora_dir.mkdir()
+    path = lora_dir / "adapter_config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_resolve_compute_dtype():
+    assert resolve_compute_dtype("fp16") == "fp16"
+    assert resolve_compute_dtype("auto") in ("bf16", "fp16", "fp32")
+
+
+@pytest.mark.skipif(torch.cuda.is_available(), reason="CPU fallback")
+def test_quantization_dropped_on_cpu_warns(capsys):
+    trainer = VLMTrainer("unused", quantization="nf4")
+    assert trainer.quantization is None
+    assert trainer.compute_dtype == torch.float32
+    assert "instead of nf4" in capsys.readouterr().out
+    VLMTrainer("unused", quantization=None)
+    assert capsys.readouterr().out == ""
+
+
+def test_adapter_config_matches(tmp_path):
+    path = write_adapter_config(tmp_path / "lora", r=16, lora_alpha=32, lora_dropout=0.05,
+                                target_modules=list(reversed(LORA_TARGET_MODULES)))
+    trainer = VLMTrainer("unused", lora_dir=str(tmp_path / "lora"))
+    assert trainer._check_adapter_config(path) == []
+
+
+def test_adapter_config_mismatch_warns(tmp_path, capsys):
+    path = write_adapter_config(tmp_path / "lora", r=8, lora_alpha=32, lora_dropout=0.05,
+                                target_modules=["q_proj", "v_proj"])
+    trainer = VLMTrainer("unused", lora_dir=str(tmp_path / "lora"))
+    assert trainer._check_adapter_config(path) == ["r", "target_modules"]
+    assert "r=8" in capsys.readouterr().out